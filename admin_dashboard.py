@@ -3,10 +3,14 @@ import pandas as pd
 import pymongo
 import joblib
 import numpy as np
-import datetime
+from dateutil.tz import tzlocal
+import threading
+import time
+import tensorflow as tf
 from tensorflow.keras.models import load_model
 import os
 from dotenv import load_dotenv
+from trip_core import load_sequence
 
 # --- CONFIGURATION ---
 # Load secrets from .env file
@@ -18,8 +22,11 @@ MONGO_URI = os.getenv("MONGO_URI")
 if not MONGO_URI:
     raise ValueError("MONGO_URI not found! Make sure .env file exists.")
 
-MODEL_PATH = "models/driver_model.h5"
+MODEL_PATH = "models/driver_model.keras"
+LEGACY_MODEL_PATH = "models/driver_model.h5"  # HDF5 model from older trainings
+TFLITE_PATH = "models/driver_model.tflite"
 SCALER_PATH = "models/scaler.pkl"
+TRIP_FEED_TTL = 30  # seconds a trip feed (cached or per-session) is reused before re-querying
 TIMESTEPS = 360
 FEATURES = ['speed', 'acceleration', 'speed_limit', 'is_speeding', 'throttle', 'brake']
 
@@ -28,24 +35,95 @@ st.set_page_config(page_title="UBI Cloud Admin", page_icon="☁️", layout="wid
 # --- DATABASE CONNECTION ---
 @st.cache_resource
 def init_connection():
-    return pymongo.MongoClient(MONGO_URI)
+    return pymongo.MongoClient(MONGO_URI, maxPoolSize=10)
 
 client = init_connection()
 db = client["ubi_database"]
 
+# --- CACHED QUERIES ---
+@st.cache_data(ttl=60)
+def get_users():
+    return list(db.users.find())
+
+@st.cache_data(ttl=TRIP_FEED_TTL)
+def get_trip_summary(user_id):
+    """Lightweight trip feed for a user. The full sequence is only pulled for the trip being analyzed."""
+    pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$sort": {"timestamp": -1}},
+        {"$project": {
+            "trip_id": 1,
+            "timestamp": 1,
+            "risk_label": 1,
+            # "$sequence.time" resolves for both columnar and per-point sequences
+            "seq_len": {"$size": "$sequence.time"}
+        }}
+    ]
+    # Projected rows are tiny, so one large batch returns the whole feed in a single round-trip
+    return list(db.trips.aggregate(pipeline, batchSize=500))
+
+def get_session_trips(user_id):
+    """
+    Per-session copy of the trip summary, reseeded when the selected user changes or the copy
+    is older than TRIP_FEED_TTL, so new uploads still show up without a manual refresh.
+    Assessments patch rows in place, so reruns within the window do not go back to Mongo.
+    """
+    stale = time.monotonic() - st.session_state.get("trips_fetched_at", float("-inf")) > TRIP_FEED_TTL
+    if stale or st.session_state.get("trips_user_id") != user_id:
+        st.session_state["trips_user_id"] = user_id
+        st.session_state["trips_fetched_at"] = time.monotonic()
+        st.session_state["trips"] = get_trip_summary(user_id)
+    return st.session_state["trips"]
+
+def reset_session_trips():
+    st.session_state.pop("trips_user_id", None)
+    st.session_state.pop("trips_fetched_at", None)
+    get_trip_summary.clear()
+
 # --- HELPER FUNCTIONS ---
 @st.cache_resource
 def load_ai_model():
-    model = load_model(MODEL_PATH)
+    """
+    Returns a predict function for a single (1, TIMESTEPS, FEATURES) input and the scaling vectors.
+    Prefers the TFLite export (written by train_model.py) and falls back to the Keras model
+    (.keras, or a legacy .h5).
+    """
     scaler = joblib.load(SCALER_PATH)
-    return model, scaler
+    # MinMaxScaler.transform is just x * scale_ + min_; keep those as float32
+    # vectors so inference skips sklearn's validation and dtype handling.
+    scaling = (scaler.scale_.astype(np.float32), scaler.min_.astype(np.float32))
+
+    if os.path.exists(TFLITE_PATH):
+        interpreter = tf.lite.Interpreter(model_path=TFLITE_PATH)
+        interpreter.allocate_tensors()
+        in_idx = interpreter.get_input_details()[0]["index"]
+        out_idx = interpreter.get_output_details()[0]["index"]
+        # The interpreter is shared by every session, and invoke() is not thread-safe
+        lock = threading.Lock()
+
+        def predict(input_data):
+            with lock:
+                interpreter.set_tensor(in_idx, input_data)
+                interpreter.invoke()
+                return float(interpreter.get_tensor(out_idx)[0][0])
+    else:
+        model = load_model(MODEL_PATH if os.path.exists(MODEL_PATH) else LEGACY_MODEL_PATH)
+
+        def predict(input_data):
+            return float(model(input_data, training=False).numpy()[0][0])
+
+    # Warm-up pass: the input shape is fixed, so pay the first-call cost here
+    # instead of on the first real assessment.
+    predict(np.zeros((1, TIMESTEPS, len(FEATURES)), dtype=np.float32))
+    return predict, scaling
 
 def generate_trip_explanation(trip_data):
     """
     Scans the trip sequence to find risky events with GRACE PERIOD logic.
     """
-    events = []
-    sequence = trip_data['sequence']
+    df = load_sequence(trip_data)
+    if df.empty:
+        return pd.DataFrame()
     
     # Thresholds
     HARD_BRAKE_THRESH = -3.0
@@ -54,69 +132,57 @@ def generate_trip_explanation(trip_data):
     
     # Grace Period Logic
     grace_duration = 5.0  # seconds to adjust to new limit
-    grace_end_time = -1.0
-    prev_limit = sequence[0]['speed_limit'] if sequence else 0
-
-    for i, point in enumerate(sequence):
-        timestamp = point['time']
-        speed = point['speed']
-        limit = point['speed_limit']
-        accel = point['acceleration']
-        
-        # 1. Check for Limit Drop (Start Grace Period)
-        if limit < prev_limit:
-            # We entered a slower zone. Give them time to slow down.
-            grace_end_time = timestamp + grace_duration
-            
-        prev_limit = limit
-        
-        # 2. Speeding Check with Grace Logic
-        is_in_grace_period = (timestamp < grace_end_time)
-        
-        # If in grace period, ONLY flag if they are NOT slowing down (accel >= 0)
-        # If not in grace period, flag normally
-        if speed > (limit + SPEEDING_BUFFER):
-            should_flag = True
-            
-            if is_in_grace_period:
-                if accel < -0.5: 
-                    # They are braking actively, so forgive the speeding
-                    should_flag = False
-                else:
-                    # They are speeding AND not slowing down -> Flag it
-                    should_flag = True
-            
-            if should_flag:
-                # Reduce frequency: Only log every ~1 second (every 10th frame)
-                # This prevents the "flood" of logs you saw in your screenshot
-                if i % 10 == 0: 
-                    events.append({
-                        "time": timestamp,
-                        "type": "Speeding",
-                        "value": f"{int(speed)} km/h (Limit: {limit})",
-                        "severity": "High" if speed > limit + 15 else "Moderate"
-                    })
-            
-        # 3. Hard Braking / Rapid Accel (Always Check)
-        elif accel < HARD_BRAKE_THRESH:
-             if i % 10 == 0: # Debounce
-                events.append({
-                    "time": timestamp,
-                    "type": "Hard Brake",
-                    "value": f"{accel} m/s²",
-                    "severity": "High"
-                })
-            
-        elif accel > RAPID_ACCEL_THRESH:
-             if i % 10 == 0: # Debounce
-                events.append({
-                    "time": timestamp,
-                    "type": "Rapid Accel",
-                    "value": f"{accel} m/s²",
-                    "severity": "Moderate"
-                })
 
-    return pd.DataFrame(events)
+    time = df['time']
+    speed = df['speed']
+    limit = df['speed_limit']
+    accel = df['acceleration']
+
+    # 1. Limit Drop starts a Grace Period (entered a slower zone, give them time to slow down)
+    limit_drop = limit.diff() < 0
+    grace_end_time = (time.where(limit_drop) + grace_duration).ffill()
+    is_in_grace_period = time < grace_end_time
+
+    # 2. Speeding Check with Grace Logic
+    # In a grace period, forgive the speeding if they are braking actively
+    speeding = speed > (limit + SPEEDING_BUFFER)
+    forgiven = is_in_grace_period & (accel < -0.5)
+
+    # 3. Hard Braking / Rapid Accel (only when not over the limit)
+    hard_brake = ~speeding & (accel < HARD_BRAKE_THRESH)
+    rapid_accel = ~speeding & ~hard_brake & (accel > RAPID_ACCEL_THRESH)
+
+    # Reduce frequency: Only log every ~1 second (every 10th frame)
+    debounce = (np.arange(len(df)) % 10) == 0
+
+    event_type = np.select(
+        [speeding & ~forgiven, hard_brake, rapid_accel],
+        ["Speeding", "Hard Brake", "Rapid Accel"],
+        default=""
+    )
+    mask = debounce & (event_type != "")
+    if not mask.any():
+        return pd.DataFrame()
+
+    ev = df[mask]
+    ev_type = event_type[mask]
+    is_speed_event = ev_type == "Speeding"
+
+    speed_value = ev['speed'].astype(int).astype(str) + " km/h (Limit: " + ev['speed_limit'].astype(str) + ")"
+    # Rounded for display: older uploads hold widened float32 values (e.g. 4.198566436767578)
+    accel_value = ev['acceleration'].round(2).astype(str) + " m/s²"
+    severity = np.where(
+        is_speed_event,
+        np.where(ev['speed'] > ev['speed_limit'] + 15, "High", "Moderate"),
+        np.where(ev_type == "Hard Brake", "High", "Moderate")
+    )
+
+    return pd.DataFrame({
+        "time": ev['time'].round(2).to_numpy(),
+        "type": ev_type,
+        "value": np.where(is_speed_event, speed_value, accel_value),
+        "severity": severity
+    })
 
 
 def get_risk_verdict(score):
@@ -124,29 +190,46 @@ def get_risk_verdict(score):
     if score < 0.7: return "MODERATE", "🟡", "Standard Premium"
     return "HIGH RISK", "🔴", "Premium Hike: +20%"
 
-def analyze_trip_ai(trip_data, model, scaler):
+# Verdict bands in get_risk_verdict order: [0, 0.3), [0.3, 0.7), [0.7, inf)
+RISK_BINS = [-np.inf, 0.3, 0.7, np.inf]
+
+def build_trip_table(trips):
+    """Builds the trip feed table from the projected trip summary with column-wise ops."""
+    df = pd.DataFrame(trips).reindex(columns=['trip_id', 'timestamp', 'risk_label', 'seq_len'])
+    risk = pd.to_numeric(df['risk_label'], errors='coerce')
+    pending = risk.isna()
+
+    # Lower edge of each band gives its verdict
+    verdicts = [get_risk_verdict(score) for score in (0.0, 0.3, 0.7)]
+    status = pd.cut(risk, RISK_BINS, right=False, labels=[f"{v} {icon}" for v, icon, _ in verdicts])
+    premium = pd.cut(risk, RISK_BINS, right=False, labels=[adj for _, _, adj in verdicts])
+
+    dates = pd.to_datetime(df['timestamp'].fillna(0), unit='s', utc=True).dt.tz_convert(tzlocal())
+
+    return pd.DataFrame({
+        "Trip ID": df['trip_id'],
+        "Date": dates.dt.strftime('%Y-%m-%d %H:%M'),
+        "Duration": (df['seq_len'] / 10).map("{:.1f}s".format),
+        "Status": status.astype(object).where(~pending, "PENDING ⏳"),
+        "Premium Action": premium.astype(object).where(~pending, "---")
+    })
+
+def analyze_trip_ai(trip_data, predict, scaling):
     """Runs prediction on trip data fetched from cloud."""
     # Preprocess
-    raw_sequence = []
-    for point in trip_data['sequence']:
-        features = [point[f] for f in FEATURES]
-        raw_sequence.append(features)
-        
-    raw_sequence = np.array(raw_sequence)
+    raw_sequence = load_sequence(trip_data)[FEATURES].to_numpy(dtype=np.float32)
     
     # Fix Length
     if len(raw_sequence) > TIMESTEPS:
         raw_sequence = raw_sequence[:TIMESTEPS]
     elif len(raw_sequence) < TIMESTEPS:
-        padding = np.tile(raw_sequence[-1], (TIMESTEPS - len(raw_sequence), 1))
-        raw_sequence = np.vstack((raw_sequence, padding))
+        raw_sequence = np.pad(raw_sequence, ((0, TIMESTEPS - len(raw_sequence)), (0, 0)), mode="edge")
         
     # Predict
-    scaled_sequence = scaler.transform(raw_sequence)
+    scale, offset = scaling
+    scaled_sequence = raw_sequence * scale + offset
     input_data = scaled_sequence.reshape(1, TIMESTEPS, len(FEATURES))
-    prediction = model.predict(input_data, verbose=0)[0][0]
-    
-    return float(prediction)
+    return predict(input_data)
 
 # --- MAIN APP ---
 def main():
@@ -155,14 +238,14 @@ def main():
     st.divider()
 
     try:
-        model, scaler = load_ai_model()
+        predict, scaling = load_ai_model()
     except:
-        st.error("Model not found. Ensure models/driver_model.h5 exists.")
+        st.error("Model not found. Ensure models/driver_model.keras (or .h5) exists.")
         return
 
     # Sidebar: User Selection from Cloud
     st.sidebar.header("📁 Policy Holders")
-    users = list(db.users.find())
+    users = get_users()
     
     if not users:
         st.warning("No users in Cloud DB. Run db_setup.py")
@@ -173,8 +256,11 @@ def main():
     selected_user = next(u for u in users if u['name'] == selected_name)
     user_id = selected_user['user_id']
 
+    if st.sidebar.button("🔄 Refresh Trips"):
+        reset_session_trips()
+
     # Fetch Trips for this User from Cloud
-    trips = list(db.trips.find({"user_id": user_id}).sort("timestamp", -1))
+    trips = get_session_trips(user_id)
 
     # --- Metrics ---
     c1, c2, c3 = st.columns(3)
@@ -187,35 +273,10 @@ def main():
     # --- Trip History Table ---
     st.subheader(f"📡 Trip Feed: {selected_name}")
     
-    trip_rows = []
-    pending_trips = []
+    pending_trips = [t for t in trips if t.get('risk_label') is None]
 
-    for t in trips:
-        risk_val = t.get('risk_label')
-        
-        # Format Date
-        ts = t.get('timestamp', 0)
-        date_str = datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M')
-
-        if risk_val is None:
-            status = "PENDING ⏳"
-            premium = "---"
-            pending_trips.append(t)
-        else:
-            verdict, icon, premium_adj = get_risk_verdict(risk_val)
-            status = f"{verdict} {icon}"
-            premium = premium_adj
-
-        trip_rows.append({
-            "Trip ID": t.get('trip_id'),
-            "Date": date_str,
-            "Duration": f"{len(t['sequence'])/10:.1f}s",
-            "Status": status,
-            "Premium Action": premium
-        })
-
-    if trip_rows:
-        st.dataframe(pd.DataFrame(trip_rows), use_container_width=True)
+    if trips:
+        st.dataframe(build_trip_table(trips), use_container_width=True)
     else:
         st.info("Waiting for data from vehicle...")
 
@@ -230,11 +291,12 @@ def main():
         selected_trip_id = st.selectbox("Select Trip to Analyze", list(trip_options.keys()))
         
         if st.button("Run AI Risk Assessment", type="primary"):
-            target_trip = trip_options[selected_trip_id]
+            trip_row = trip_options[selected_trip_id]
+            target_trip = db.trips.find_one({"_id": trip_row["_id"]})
             
             with st.spinner("Fetching data from cloud & processing..."):
                 # 1. Run Model
-                score = analyze_trip_ai(target_trip, model, scaler)
+                score = analyze_trip_ai(target_trip, predict, scaling)
                 
                 # 2. Run Explainability Engine
                 explanation_df = generate_trip_explanation(target_trip)
@@ -244,6 +306,9 @@ def main():
                     {"_id": target_trip["_id"]},
                     {"$set": {"risk_label": score}}
                 )
+                # Patch this session's row; other sessions re-read on their next cache miss
+                trip_row["risk_label"] = score
+                get_trip_summary.clear()
                 
             # --- DISPLAY RESULTS ---
             verdict, icon, adj = get_risk_verdict(score)
@@ -258,9 +323,10 @@ def main():
             if not explanation_df.empty:
                 # 1. Summary Metrics
                 c1, c2, c3 = st.columns(3)
-                n_speeding = len(explanation_df[explanation_df['type'] == 'Speeding'])
-                n_brake = len(explanation_df[explanation_df['type'] == 'Hard Brake'])
-                n_accel = len(explanation_df[explanation_df['type'] == 'Rapid Accel'])
+                counts = explanation_df['type'].value_counts()
+                n_speeding = int(counts.get('Speeding', 0))
+                n_brake = int(counts.get('Hard Brake', 0))
+                n_accel = int(counts.get('Rapid Accel', 0))
                 
                 c1.metric("Speeding Incidents", n_speeding, delta_color="inverse")
                 c2.metric("Hard Brakes", n_brake, delta_color="inverse")
@@ -271,7 +337,7 @@ def main():
                 st.markdown("#### Trip Velocity Profile")
                 
                 # Convert sequence to DF for plotting
-                seq_df = pd.DataFrame(target_trip['sequence'])
+                seq_df = load_sequence(target_trip)
                 
                 # We use a line chart for speed and limit
                 chart_data = seq_df[['time', 'speed', 'speed_limit']].set_index('time')
@@ -298,6 +364,7 @@ def main():
                 st.success("✅ No specific risk events detected. The driver demonstrated smooth, compliant behavior.")
 
             if st.button("Refresh Data"):
+                reset_session_trips()
                 st.rerun()
 
     else:
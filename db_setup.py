@@ -1,4 +1,6 @@
 import pymongo
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
 import datetime
 import os
 from dotenv import load_dotenv
@@ -15,6 +17,7 @@ if not MONGO_URI:
 client = pymongo.MongoClient(MONGO_URI)
 db = client["ubi_database"]
 users_col = db["users"]
+trips_col = db["trips"]
 
 # List of dummy users to create
 dummy_users = [
@@ -46,12 +49,36 @@ dummy_users = [
 
 print("--- Initializing User Database ---")
 
-for user in dummy_users:
-    # Check if user already exists to avoid duplicates
-    if not users_col.find_one({"user_id": user["user_id"]}):
-        users_col.insert_one(user)
+# Unique index lets the server reject duplicates, so we can insert in one batch
+users_col.create_index("user_id", unique=True)
+
+# Failed inserts by index; code 11000 (duplicate key) just means the user is already there
+write_errors = {}
+try:
+    users_col.insert_many(dummy_users, ordered=False)
+except BulkWriteError as e:
+    write_errors = {err["index"]: err for err in e.details["writeErrors"]}
+
+for i, user in enumerate(dummy_users):
+    err = write_errors.get(i)
+    if err is None:
         print(f"✅ Created User: {user['name']} ({user['user_id']})")
-    else:
+    elif err["code"] == 11000:
         print(f"ℹ️  User already exists: {user['name']}")
+    else:
+        print(f"❌ ERROR: Could not create user {user['name']}: {err.get('errmsg')} (code {err['code']})")
+
+print("--- Initializing Trip Indexes ---")
+
+# Trip feed: find({"user_id": u}).sort("timestamp", -1) is served presorted from the index
+trips_col.create_index([("user_id", ASCENDING), ("timestamp", DESCENDING)])
+# Pending-only lookups: find({"user_id": u, "risk_label": None})
+trips_col.create_index([("user_id", ASCENDING), ("risk_label", ASCENDING)])
+
+plan = trips_col.find({"user_id": dummy_users[0]["user_id"]}).sort("timestamp", -1).explain()
+if "IXSCAN" in str(plan["queryPlanner"]["winningPlan"]):
+    print("✅ Trip feed query uses an index scan")
+else:
+    print("⚠️  Trip feed query is not using an index scan")
 
 print("--- Database Setup Complete ---")
\ No newline at end of file
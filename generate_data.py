@@ -1,15 +1,20 @@
 import numpy as np
 import pandas as pd
-import json
+import orjson
 import os
-import random
+from joblib import Parallel, delayed
+from numba import njit
+from trip_core import QUANT_SCALES, create_trip_plan, get_limit_by_step, dequantize
 
 # --- 1. Configuration ---
 DATA_DIR = "data/raw"
+PARQUET_PATH = "data/trips.parquet"   # all trips in one columnar file, for training
 NUM_TRIPS_PER_STYLE = 500   # Increased for a more stable model
 TRIP_DURATION = 360         # seconds per trip
 TIMESTEP = 1.0              # 1 second calculation interval
 
+# Stored telemetry is quantized with trip_core.QUANT_SCALES (value = stored / scale)
+
 # --- 2. Physics & Vehicle Constants ---
 CAR_MASS = 1500.0             # kg
 MAX_ENGINE_FORCE = 3000.0     # Newtons
@@ -18,12 +23,8 @@ DRAG_COEFFICIENT = 0.3        # Aerodynamic drag coeff.
 AIR_DENSITY = 1.225           # kg/m^3
 CAR_FRONTAL_AREA = 2.2        # m^2
 
-# --- 3. Speed Zone Definitions (km/h) ---
-SPEED_ZONES = {
-    "residential": 30,
-    "main_road": 60,
-    "highway": 80
-}
+# --- 3. Speed Zones & Trip Plans ---
+# SPEED_ZONES, create_trip_plan and get_limit_by_step live in trip_core.py (shared with play_trip.py)
 
 # --- 4. Driver Profiles (THIS is where you control behavior) ---
 DRIVER_PROFILES = {
@@ -52,33 +53,7 @@ DRIVER_PROFILES = {
 # Ensure directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# --- 5. Trip Plan Functions ---
-def create_trip_plan(duration):
-    """Creates a random sequence of speed zones for a trip."""
-    plan = []
-    current_time = 0
-    while current_time < duration:
-        zone_name = random.choice(list(SPEED_ZONES.keys()))
-        speed_limit = SPEED_ZONES[zone_name]
-        zone_duration = random.randint(20, 40)
-        end_time = min(current_time + zone_duration, duration)
-        
-        plan.append({
-            "start": current_time,
-            "end": end_time,
-            "limit": speed_limit
-        })
-        current_time = end_time
-    return plan
-
-def get_current_limit(time, plan):
-    """Finds the speed limit (in km/h) at a specific time."""
-    for zone in plan:
-        if zone["start"] <= time < zone["end"]:
-            return zone["limit"]
-    return plan[-1]["limit"]
-
-# --- 6. Helper: Driver Controller ---
+# --- 5. Helper: Driver Controller ---
 def compute_driver_inputs(
     current_speed_ms,
     speed_limit_kmh,
@@ -135,19 +110,75 @@ def compute_driver_inputs(
 
     return throttle_input, brake_input, desired_accel
 
+# --- 6. Trip Simulation Kernel ---
+@njit(cache=True)
+def _simulate(limits, target_speed_factor, throttle_gain, brake_gain, tap_mask, tap_delta):
+    """
+    Runs the driver controller and physics integrator over a whole trip.
+    Pure numeric so Numba can compile it; noise is sampled by the caller.
+    """
+    n = limits.shape[0]
+    speed_ms = np.empty(n)
+    accel_ms2 = np.empty(n)
+    throttle = np.empty(n)
+    brake = np.empty(n)
+
+    drag_const = 0.75 * AIR_DENSITY * DRAG_COEFFICIENT * CAR_FRONTAL_AREA
+
+    # Physics variables (use m/s for calculations)
+    current_speed_ms = 0.0
+
+    for t in range(n):
+        target_speed_ms = (limits[t] * target_speed_factor) / 3.6
+
+        # --- 6a. Driver Agent Logic (Base Input) ---
+        throttle_input = 0.0
+        brake_input = 0.0
+        error = target_speed_ms - current_speed_ms
+
+        if error > 1.0:
+            throttle_input = min(1.0, error * throttle_gain)
+        elif error < -1.0:
+            brake_input = min(1.0, -error * brake_gain)
+
+        # --- Keyboard Jerkiness/Noise ---
+        # This simulates the high-frequency up/down of human tapping input.
+        if tap_mask[t]:
+            noise_delta = tap_delta[t]
+            if throttle_input > 0:
+                throttle_input = min(1.0, max(0.0, throttle_input + noise_delta))
+            if brake_input > 0:
+                brake_input = min(1.0, max(0.0, brake_input + noise_delta))
+
+        # --- 6b. Physics Engine Logic ---
+        force_engine = throttle_input * MAX_ENGINE_FORCE
+        force_brake = brake_input * MAX_BRAKE_FORCE
+        force_drag = -drag_const * current_speed_ms * current_speed_ms
+
+        net_force = force_engine - force_brake + force_drag
+        acceleration_ms2 = net_force / CAR_MASS
+
+        current_speed_ms += acceleration_ms2 * TIMESTEP
+
+        if current_speed_ms < 0: current_speed_ms = 0.0
+        if current_speed_ms > 55.0: current_speed_ms = 55.0
+
+        speed_ms[t] = current_speed_ms
+        accel_ms2[t] = acceleration_ms2
+        throttle[t] = throttle_input
+        brake[t] = brake_input
+
+    return speed_ms, accel_ms2, throttle, brake
+
 # --- 7. Main Simulation Function ---
 def generate_trip(style, trip_id):
     """
     Generates a trip using a physics and driver-agent simulation,
     now including input "jerkiness" for robust training.
     """
-    time_steps = np.arange(TRIP_DURATION)
-    data_points = []
-    
-    # Physics variables (use m/s for calculations)
-    current_speed_ms = 0.0
-    
     trip_plan = create_trip_plan(TRIP_DURATION)
+
+    limits = get_limit_by_step(trip_plan, TRIP_DURATION, TIMESTEP)
     
     if style == 'aggressive':
         target_speed_factor = 1.25 
@@ -162,94 +193,91 @@ def generate_trip(style, trip_id):
         risk_score = 0.1
         input_noise_factor = 0.15 # Safe inputs have some keyboard noise, but less extreme
 
-    for t in time_steps:
-        current_speed_limit_kmh = get_current_limit(t, trip_plan)
-        target_speed_ms = (current_speed_limit_kmh * target_speed_factor) / 3.6
-        
-        # --- 5a. Driver Agent Logic (Base Input) ---
-        throttle_input = 0.0
-        brake_input = 0.0
-        error = target_speed_ms - current_speed_ms
-        
-        if error > 1.0: 
-            throttle_input = min(1.0, error * throttle_gain) 
-        elif error < -1.0: 
-            brake_input = min(1.0, abs(error) * brake_gain) 
+    # Pre-sample the keyboard "tap" noise for the whole trip.
+    # 30% chance per step of a random input "tap" event.
+    tap_mask = np.random.random(TRIP_DURATION) < 0.3
+    tap_delta = np.random.uniform(-input_noise_factor, input_noise_factor, TRIP_DURATION)
 
-        # --- NEW: Introduce Keyboard Jerkiness/Noise ---
-        # This simulates the high-frequency up/down of human tapping input.
-        if np.random.random() < 0.3: # 30% chance of a random input "tap" event
-            
-            # Apply a random delta scaled by the factor
-            noise_delta = np.random.uniform(-input_noise_factor, input_noise_factor)
-            
-            # Apply to throttle and clip
-            if throttle_input > 0:
-                throttle_input = np.clip(throttle_input + noise_delta, 0.0, 1.0)
-            
-            # Apply to brake and clip
-            if brake_input > 0:
-                brake_input = np.clip(brake_input + noise_delta, 0.0, 1.0)
-        
-        # --- 5b. Physics Engine Logic ---
-        force_engine = throttle_input * MAX_ENGINE_FORCE
-        force_brake = brake_input * MAX_BRAKE_FORCE
-        force_drag = -0.75 * AIR_DENSITY * DRAG_COEFFICIENT * CAR_FRONTAL_AREA * (current_speed_ms ** 2)
-        
-        net_force = force_engine - force_brake + force_drag
-        acceleration_ms2 = net_force / CAR_MASS
-        
-        current_speed_ms += acceleration_ms2 * TIMESTEP
-        
-        if current_speed_ms < 0: current_speed_ms = 0.0
-        if current_speed_ms > 55.0: current_speed_ms = 55.0 
-
-        # --- 5c. Store Data Point ---
-        current_speed_kmh = current_speed_ms * 3.6
-        current_speed_limit_kmh = get_current_limit(t, trip_plan) # Re-fetch limit for safety
-        
-        point = {
-            "time": int(t),
-            "speed": round(current_speed_kmh, 2),
-            "acceleration": round(acceleration_ms2, 2), 
-            "speed_limit": current_speed_limit_kmh,
-            "is_speeding": 1 if current_speed_kmh > (current_speed_limit_kmh + 2) else 0,
-            "throttle": round(throttle_input, 2),
-            "brake": round(brake_input, 2)
-        }
-        data_points.append(point)
+    speed_ms, accel_ms2, throttle, brake = _simulate(
+        limits.astype(np.float64),
+        target_speed_factor, throttle_gain, brake_gain,
+        tap_mask, tap_delta
+    )
+
+    # --- 7a. Store Data Columns ---
+    # Columnar layout: one array per field rather than one dict per second.
+    # Each column is converted in a single vectorized pass (no per-point round()/int()),
+    # and the arrays are kept as numpy - orjson serializes them directly.
+    speed_kmh = np.multiply(speed_ms, 3.6, out=speed_ms)
+    is_speeding = (speed_kmh > limits + 2).astype(np.uint8)
+    
+    columns = {"speed": speed_kmh, "acceleration": accel_ms2, "throttle": throttle, "brake": brake}
+    for name, values in columns.items():
+        values *= QUANT_SCALES[name]
+        np.round(values, out=values)
+    
+    sequence = {
+        "time": np.arange(TRIP_DURATION, dtype=np.int32) * QUANT_SCALES["time"],
+        "speed": speed_kmh.astype(np.int16),
+        "acceleration": accel_ms2.astype(np.int16),
+        "speed_limit": limits.astype(np.int32),
+        "is_speeding": is_speeding,
+        "throttle": throttle.astype(np.uint8),
+        "brake": brake.astype(np.uint8)
+    }
 
     trip_data = {
         "trip_id": trip_id,
         "style": style,
         "risk_label": risk_score,
         "trip_plan": trip_plan,
-        "sequence": data_points
+        "quant": QUANT_SCALES,
+        "sequence": sequence
     }
     
     return trip_data
 
 # --- 8. Main Execution ---
+def _gen_and_write(style, i, seed_seq):
+    """Worker task: simulates one trip and writes it to DATA_DIR."""
+    # Worker processes are reused, so re-seed per task from the job's own stream
+    # (independent of which worker runs it) to keep noise independent
+    np.random.seed(seed_seq.generate_state(4))
+
+    trip = generate_trip(style, f"{style}_{i}")
+    filename = f"{DATA_DIR}/{style}_{i}.json"
+    with open(filename, "wb") as f:
+        f.write(orjson.dumps(trip, option=orjson.OPT_SERIALIZE_NUMPY))
+    return trip
+
+def trips_to_frame(trips):
+    """Flattens columnar trips into one long table with a row per trip second."""
+    frames = []
+    for trip in trips:
+        df = pd.DataFrame(trip["sequence"])
+        for col in trip["quant"]:
+            df[col] = dequantize(col, df[col], trip["quant"]).astype(np.float32)
+        df.insert(0, "trip_id", trip["trip_id"])
+        df.insert(1, "style", trip["style"])
+        df.insert(2, "risk_label", trip["risk_label"])
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
 def main():
     print(f"Generating {NUM_TRIPS_PER_STYLE * 2} physics-simulated trips...")
     
-    trip_count = 0
-    
-    for i in range(NUM_TRIPS_PER_STYLE):
-        trip = generate_trip("safe", f"safe_{i}")
-        filename = f"{DATA_DIR}/safe_{i}.json"
-        with open(filename, "w") as f:
-            json.dump(trip, f, indent=4)
-        trip_count += 1
-        
-    for i in range(NUM_TRIPS_PER_STYLE):
-        trip = generate_trip("aggressive", f"aggressive_{i}")
-        filename = f"{DATA_DIR}/aggressive_{i}.json"
-        with open(filename, "w") as f:
-            json.dump(trip, f, indent=4)
-        trip_count += 1
+    # Trips share no state, so fan them out across all cores
+    jobs = [(style, i) for style in ("safe", "aggressive") for i in range(NUM_TRIPS_PER_STYLE)]
+    seed_seqs = np.random.SeedSequence().spawn(len(jobs))
+    trips = Parallel(n_jobs=-1, backend="loky")(
+        delayed(_gen_and_write)(style, i, seed_seq) for (style, i), seed_seq in zip(jobs, seed_seqs)
+    )
+    trip_count = len(trips)
 
     print(f"Success! Generated {trip_count} trips in '{DATA_DIR}'")
 
+    trips_to_frame(trips).to_parquet(PARQUET_PATH, compression="zstd", index=False)
+    print(f"Wrote training table to '{PARQUET_PATH}'")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,29 +1,37 @@
 import pygame
 import numpy as np
-import json
+import argparse
+import orjson
 import os
 import random
 import time
 import math
 import pymongo 
+import threading
+from collections import deque
+from bson import ObjectId
 import os
+from numba import njit
 from dotenv import load_dotenv
+from trip_core import SPEED_ZONES, QUANT_SCALES, create_trip_plan, get_limit_by_step
 
 # --- CONFIGURATION ---
 # Load secrets from .env file
 load_dotenv()
 
-# Get the value
+# Get the value (only needed to upload; checked in upload_trip so --headless runs without it)
 MONGO_URI = os.getenv("MONGO_URI")
 
-if not MONGO_URI:
-    raise ValueError("MONGO_URI not found! Make sure .env file exists.")
-
 DATA_DIR = "data/raw_human"
+SYNTHETIC_DATA_DIR = "data/raw_synthetic"   # headless trips, kept apart from the human ones
 TRIP_DURATION = 120          
 TIMESTEP = 0.1               
 SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 600
+RENDER_FPS = 60              # display rate; physics still steps every TIMESTEP
+
+# Let SDL coalesce same-state draw calls when the GPU renderer (--gpu) is used
+os.environ.setdefault("SDL_RENDER_BATCHING", "1")
 
 # --- 2. Physics Constants (TUNED) ---
 CAR_MASS = 1500.0             
@@ -34,172 +42,470 @@ ROLLING_RESISTANCE = 200.0
 AIR_DENSITY = 1.225
 CAR_FRONTAL_AREA = 2.2
 
-# --- 3. Speed Zones ---
-SPEED_ZONES = {
-    "residential": 30,
-    "main_road": 60,
-    "highway": 80
-}
+# --- 3. Trip Log Layout ---
+# Column order of the per-tick trip log
+LOG_FIELDS = ["time", "speed", "acceleration", "speed_limit", "is_speeding", "throttle", "brake"]
+
+# Saved/uploaded telemetry is quantized with trip_core.QUANT_SCALES (value = stored / scale),
+# into these integer types
+_QUANT_DTYPES = {"time": np.int32, "speed": np.int16, "acceleration": np.int16,
+                 "speed_limit": np.int16, "is_speeding": np.int16, "throttle": np.uint8, "brake": np.uint8}
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# --- 4. Helper Functions ---
-def create_trip_plan(duration):
-    plan = []
-    current_time = 0
-    while current_time < duration:
-        zone_name = random.choice(list(SPEED_ZONES.keys()))
-        speed_limit = SPEED_ZONES[zone_name]
-        zone_duration = random.randint(20, 40)
-        end_time = min(current_time + zone_duration, duration)
-        plan.append({"start": current_time, "end": end_time, "limit": speed_limit})
-        current_time = end_time
-    return plan
-
-def get_current_limit(time_s, plan):
-    for zone in plan:
-        if zone["start"] <= time_s < zone["end"]:
-            return zone["limit"]
-    return plan[-1]["limit"]
-
-# --- 5. UI Drawing Functions ---
-def draw_dashboard(screen, speed, speed_limit, throttle, brake):
-    # Colors
-    c_bg = (20, 20, 30)
-    c_gauge_bg = (40, 40, 50)
-    c_accent = (0, 200, 255)
-    c_danger = (255, 50, 50)
-    c_text = (255, 255, 255)
-    
-    # Speedometer
-    center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 150)
-    radius = 120
-    
-    # Background
-    pygame.draw.circle(screen, c_gauge_bg, center, radius, 0)
-    pygame.draw.circle(screen, c_bg, center, radius - 20, 0)
-    
-    # Needle Logic
+# --- 4. Trip Simulation (no pygame) ---
+# Per-tick pedal and physics updates are compiled once and shared by the interactive loop
+# (simulate_trip) and the fully compiled headless loop (_simulate_synthetic).
+@njit(cache=True)
+def pedal_step(pressed, value, hold_time, dt, base_step, ramp_step, ramp_time):
+    """Exponential pedal input: ramps up while held, releases by 0.15 per tick. Returns (value, hold_time)."""
+    if pressed:
+        hold_time += dt
+        step = base_step + (ramp_step * min(1.0, hold_time / ramp_time))
+        value = min(1.0, value + step)
+    else:
+        hold_time = 0.0
+        value = max(0.0, value - 0.15)
+    return value, hold_time
+
+@njit(cache=True)
+def physics_step(speed_ms, throttle_input, brake_input, dt):
+    """Advances the car one tick. Returns (speed_ms, accel)."""
+    force_engine = throttle_input * MAX_ENGINE_FORCE
+    force_brake = brake_input * MAX_BRAKE_FORCE
+    resistance = ROLLING_RESISTANCE if speed_ms > 0 else 0.0
+    force_drag = 0.5 * AIR_DENSITY * DRAG_COEFFICIENT * CAR_FRONTAL_AREA * (speed_ms ** 2)
+    net_force = force_engine - force_brake - force_drag - resistance
+    
+    accel = net_force / CAR_MASS
+    speed_ms += accel * dt
+    if speed_ms < 0: speed_ms = 0.0
+    if speed_ms > 60: speed_ms = 60.0
+    return speed_ms, accel
+
+def simulate_trip(trip_plan, input_policy, duration=TRIP_DURATION, dt=TIMESTEP, on_step=None):
+    """
+    Runs the pedal ramping, physics and logging for one trip and returns its (ticks, 7)
+    float32 log, columns in LOG_FIELDS order.
+    input_policy(frame_count, speed_kmh, limit_kmh) returns (gas, brake, panic) key states
+    for the tick, or None to end the trip early. on_step is called after every tick with
+    (frame_count, speed_kmh, limit_kmh, throttle, brake, log_so_far), e.g. to draw a frame.
+    """
+    current_speed_ms = 0.0
+    current_time_s = 0.0
+    n_steps = int(duration / dt) + 1
+    limit_by_step = get_limit_by_step(trip_plan, n_steps, dt)
+    log = np.empty((n_steps, len(LOG_FIELDS)), dtype=np.float32)
+    
+    throttle_input = 0.0
+    brake_input = 0.0
+    
+    throttle_hold_time = 0.0
+    brake_hold_time = 0.0
+    
+    frame_count = 0
+
+    while current_time_s < duration:
+        current_limit_kmh = int(limit_by_step[frame_count])
+        keys = input_policy(frame_count, current_speed_ms * 3.6, current_limit_kmh)
+        if keys is None: break
+        gas, brake, panic = keys
+        
+        # Exponential Inputs
+        throttle_input, throttle_hold_time = pedal_step(gas, throttle_input, throttle_hold_time, dt, 0.05, 0.15, 2.0)
+        brake_input, brake_hold_time = pedal_step(brake, brake_input, brake_hold_time, dt, 0.1, 0.25, 1.0)
+        
+        if panic: 
+            brake_input = 1.0; throttle_input = 0.0
+            
+        # Physics
+        current_speed_ms, accel = physics_step(current_speed_ms, throttle_input, brake_input, dt)
+        current_speed_kmh = current_speed_ms * 3.6
+        
+        is_speeding = 1 if current_speed_kmh > (current_limit_kmh + 2) else 0
+        
+        log[frame_count] = (current_time_s, current_speed_kmh, accel, current_limit_kmh,
+                            is_speeding, throttle_input, brake_input)
+        
+        if on_step is not None:
+            on_step(frame_count, current_speed_kmh, current_limit_kmh, throttle_input, brake_input, log[:frame_count + 1])
+        current_time_s += dt
+        frame_count += 1
+    
+    return log[:frame_count]
+
+def log_to_sequence(log):
+    """
+    Splits a trip log into the columnar `sequence`: one contiguous integer array per field,
+    quantized with QUANT_SCALES (store "quant": QUANT_SCALES with it).
+    """
+    sequence = {}
+    for j, field in enumerate(LOG_FIELDS):
+        col = log[:, j].astype(np.float64)
+        if field in QUANT_SCALES:
+            col = np.rint(col * QUANT_SCALES[field])
+        sequence[field] = col.astype(_QUANT_DTYPES[field])
+    return sequence
+
+@njit(cache=True)
+def _simulate_synthetic(limit_by_step, duration, dt, overshoot, panic_mask):
+    """
+    simulate_trip with the scripted driver inlined, compiled end to end: it chases
+    limit * overshoot and panic-brakes on the ticks set in panic_mask.
+    """
+    log = np.empty((len(limit_by_step), 7), dtype=np.float32)
+    speed_ms = 0.0
+    time_s = 0.0
+    throttle_input = 0.0
+    brake_input = 0.0
+    throttle_hold_time = 0.0
+    brake_hold_time = 0.0
+    
+    i = 0
+    while time_s < duration:
+        limit_kmh = limit_by_step[i]
+        target = limit_kmh * overshoot
+        speed_kmh = speed_ms * 3.6
+        
+        throttle_input, throttle_hold_time = pedal_step(speed_kmh < target - 2, throttle_input, throttle_hold_time, dt, 0.05, 0.15, 2.0)
+        brake_input, brake_hold_time = pedal_step(speed_kmh > target + 5, brake_input, brake_hold_time, dt, 0.1, 0.25, 1.0)
+        if panic_mask[i]:
+            brake_input = 1.0; throttle_input = 0.0
+        
+        speed_ms, accel = physics_step(speed_ms, throttle_input, brake_input, dt)
+        speed_kmh = speed_ms * 3.6
+        
+        log[i, 0] = time_s
+        log[i, 1] = speed_kmh
+        log[i, 2] = accel
+        log[i, 3] = limit_kmh
+        log[i, 4] = 1 if speed_kmh > (limit_kmh + 2) else 0
+        log[i, 5] = throttle_input
+        log[i, 6] = brake_input
+        time_s += dt
+        i += 1
+    return log[:i]
+
+def simulate_synthetic_trip(trip_plan, aggressiveness=0.5, duration=TRIP_DURATION, dt=TIMESTEP):
+    """
+    Headless trip with a scripted driver: it chases a target speed around the limit (above it for
+    aggressive drivers) and occasionally panic-brakes. Returns the same log as simulate_trip.
+    """
+    overshoot = 0.9 + 0.4 * aggressiveness
+    panic_prob = 0.002 * aggressiveness
+    n_steps = int(duration / dt) + 1
+    limit_by_step = get_limit_by_step(trip_plan, n_steps, dt)
+    panic_mask = np.random.random(n_steps) < panic_prob
+    return _simulate_synthetic(limit_by_step, duration, dt, overshoot, panic_mask)
+
+def run_headless(n_trips, user_id="u_001"):
+    """Generates trips at CPU speed with no window, clock cap or upload; saves them to SYNTHETIC_DATA_DIR."""
+    os.makedirs(SYNTHETIC_DATA_DIR, exist_ok=True)
+    for i in range(n_trips):
+        aggressiveness = random.random()
+        trip_plan = create_trip_plan(TRIP_DURATION)
+        log = simulate_synthetic_trip(trip_plan, aggressiveness)
+        
+        trip_id = f"synthetic_{int(time.time())}_{i}"
+        trip_data = {
+            "trip_id": trip_id,
+            "user_id": user_id,
+            "style": "synthetic",
+            "risk_label": None,
+            "trip_plan": trip_plan,
+            "quant": QUANT_SCALES,
+            "sequence": log_to_sequence(log),
+            "timestamp": time.time()
+        }
+        local_path = os.path.join(SYNTHETIC_DATA_DIR, f"{trip_id}.json")
+        with open(local_path, "wb") as f:
+            f.write(orjson.dumps(trip_data, option=orjson.OPT_SERIALIZE_NUMPY))
+    print(f"💾 Saved {n_trips} headless trips to {SYNTHETIC_DATA_DIR}")
+
+# --- 5. UI Caches ---
+# Fonts and static text are built once by init_ui_cache() (needs pygame.init() first)
+FONT_LARGE = None
+FONT_SMALL = None
+KMH_SURF = None
+LIMIT_SURFS = {}
+CHROME_SURF = None   # static gauge + sign circles, pre-rasterized
+CHROME_POS = (0, 0)
+ROAD_SURF = None     # static sky, ground and perspective guides
+SPEED_SURFS = {}     # speed readouts, rendered and converted on first use
+
+# Road geometry (invariant across frames)
+HORIZON_Y = SCREEN_HEIGHT // 2 - 50
+ROAD_CENTER_X = SCREEN_WIDTH // 2
+ROAD_DEPTH = SCREEN_HEIGHT - HORIZON_Y
+GRAPH_RECT = pygame.Rect(50, SCREEN_HEIGHT - 150, 300, 100)
+PROGRESS_RECT = pygame.Rect(0, 0, SCREEN_WIDTH, 5)
+DIRTY_RECTS = []     # regions redrawn each frame, passed to display.update()
+
+# Dashboard colors and layout (pygame.Color so the GPU renderer can take them too)
+C_BG = pygame.Color(20, 20, 30)
+C_GAUGE = pygame.Color(40, 40, 50)
+C_ACCENT = pygame.Color(0, 200, 255)
+C_DANGER = pygame.Color(255, 50, 50)
+C_THROTTLE = pygame.Color(0, 255, 100)
+C_TEXT = pygame.Color(255, 255, 255)
+C_ROAD_LINE = pygame.Color(80, 80, 80)
+C_GRAPH_BG = pygame.Color(30, 30, 40)
+C_GRAPH_BORDER = pygame.Color(100, 100, 100)
+C_LIMIT_LINE = pygame.Color(150, 50, 50)
+CENTER = (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 150)
+GAUGE_RADIUS = 120
+SIGN_POS = (CENTER[0] + 180, CENTER[1] - 50)
+SIGN_RADIUS = 45
+BAR_W, BAR_H = 20, 150
+T_BG_RECT = pygame.Rect(SCREEN_WIDTH - 80, SCREEN_HEIGHT - 200, BAR_W, BAR_H)
+B_BG_RECT = pygame.Rect(SCREEN_WIDTH - 120, SCREEN_HEIGHT - 200, BAR_W, BAR_H)
+
+def _to_display_format(surf):
+    """Converts a cached surface to the display's pixel format (keeping per-pixel alpha) so blits take the fast path."""
+    if pygame.display.get_surface() is None:
+        return surf  # GPU path: uploaded as a texture instead
+    return surf.convert_alpha() if surf.get_flags() & pygame.SRCALPHA else surf.convert()
+
+def init_ui_cache():
+    """Builds fonts and static surfaces. Call after pygame.display.set_mode so they can be converted."""
+    global FONT_LARGE, FONT_SMALL, KMH_SURF, LIMIT_SURFS, CHROME_SURF, CHROME_POS, ROAD_SURF, SPEED_SURFS, DIRTY_RECTS
+    FONT_LARGE = pygame.font.SysFont("consolas", 60, bold=True)
+    FONT_SMALL = pygame.font.SysFont("consolas", 20)
+    KMH_SURF = _to_display_format(FONT_SMALL.render("km/h", True, (150, 150, 150)))
+    # Only a handful of distinct limits exist, so pre-render each sign number
+    LIMIT_SURFS = {v: _to_display_format(FONT_LARGE.render(f"{v}", True, (0, 0, 0))) for v in SPEED_ZONES.values()}
+    SPEED_SURFS = {}
+
+    # Dashboard chrome: the gauge background and speed-limit sign never change,
+    # so draw them once into a transparent surface covering just their bounds.
+    center, radius = CENTER, GAUGE_RADIUS
+    sign_pos, sign_radius = SIGN_POS, SIGN_RADIUS
+    bounds = pygame.Rect(center[0] - radius, center[1] - radius, 2 * radius, 2 * radius).union(
+        pygame.Rect(sign_pos[0] - sign_radius, sign_pos[1] - sign_radius, 2 * sign_radius, 2 * sign_radius))
+    CHROME_POS = bounds.topleft
+    
+    CHROME_SURF = _to_display_format(pygame.Surface(bounds.size, pygame.SRCALPHA))
+    CHROME_SURF.fill((0, 0, 0, 0))
+    local_center = (center[0] - bounds.x, center[1] - bounds.y)
+    local_sign = (sign_pos[0] - bounds.x, sign_pos[1] - bounds.y)
+    pygame.draw.circle(CHROME_SURF, C_GAUGE, local_center, radius, 0)
+    pygame.draw.circle(CHROME_SURF, C_BG, local_center, radius - 20, 0)
+    pygame.draw.circle(CHROME_SURF, (200, 200, 200), local_sign, sign_radius)
+    pygame.draw.circle(CHROME_SURF, (200, 0, 0), local_sign, sign_radius, 8)
+
+    # Road backdrop: everything except the moving horizontal lines
+    ROAD_SURF = _to_display_format(pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)))
+    pygame.draw.rect(ROAD_SURF, (10, 10, 15), (0, 0, SCREEN_WIDTH, HORIZON_Y))
+    pygame.draw.rect(ROAD_SURF, (40, 40, 40), (0, HORIZON_Y, SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.draw.line(ROAD_SURF, (100, 100, 100), (ROAD_CENTER_X, HORIZON_Y), (0, SCREEN_HEIGHT), 2)
+    pygame.draw.line(ROAD_SURF, (100, 100, 100), (ROAD_CENTER_X, HORIZON_Y), (SCREEN_WIDTH, SCREEN_HEIGHT), 2)
+
+    # Only the ground band changes between frames: the moving road lines span it and
+    # the gauge, sign, pedals and graph all sit inside it. Plus the progress bar.
+    road_lines = pygame.Rect(ROAD_CENTER_X - 412, HORIZON_Y, 824, ROAD_DEPTH)
+    pedals = B_BG_RECT.union(T_BG_RECT)
+    DIRTY_RECTS = [road_lines.union(bounds).union(pedals).union(GRAPH_RECT), PROGRESS_RECT]
+
+# --- 6. UI Drawing Functions ---
+def needle_end(speed):
+    """Tip of the speedometer needle for a speed in km/h."""
+    center, radius = CENTER, GAUGE_RADIUS
     max_disp_speed = 140
     angle_start = 225
     angle_end = -45
     angle_range = angle_start - angle_end
     speed_angle = angle_start - (min(speed, max_disp_speed) / max_disp_speed) * angle_range
     rad_angle = math.radians(speed_angle)
-    end_pos = (center[0] + (radius - 10) * math.cos(-rad_angle), 
-               center[1] + (radius - 10) * math.sin(-rad_angle))
-    pygame.draw.line(screen, c_accent, center, end_pos, 4)
+    return (center[0] + (radius - 10) * math.cos(-rad_angle), 
+            center[1] + (radius - 10) * math.sin(-rad_angle))
+
+def draw_dashboard(screen, speed, speed_limit, throttle, brake):
+    # Background (gauge + speed-limit sign circles)
+    screen.blit(CHROME_SURF, CHROME_POS)
+    
+    # Needle
+    pygame.draw.line(screen, C_ACCENT, CENTER, needle_end(speed), 4)
     
     # Text
-    font_large = pygame.font.SysFont("consolas", 60, bold=True)
-    txt_speed = font_large.render(f"{int(speed)}", True, c_text)
-    screen.blit(txt_speed, (center[0] - txt_speed.get_width()//2, center[1] - 40))
-    font_small = pygame.font.SysFont("consolas", 20)
-    txt_unit = font_small.render("km/h", True, (150, 150, 150))
-    screen.blit(txt_unit, (center[0] - txt_unit.get_width()//2, center[1] + 20))
+    speed_int = int(speed)
+    txt_speed = SPEED_SURFS.get(speed_int)
+    if txt_speed is None:
+        txt_speed = SPEED_SURFS[speed_int] = _to_display_format(FONT_LARGE.render(f"{speed_int}", True, C_TEXT))
+    screen.blit(txt_speed, (CENTER[0] - txt_speed.get_width()//2, CENTER[1] - 40))
+    screen.blit(KMH_SURF, (CENTER[0] - KMH_SURF.get_width()//2, CENTER[1] + 20))
 
     # Speed Limit Sign
-    sign_pos = (center[0] + 180, center[1] - 50)
-    pygame.draw.circle(screen, (200, 200, 200), sign_pos, 45)
-    pygame.draw.circle(screen, (200, 0, 0), sign_pos, 45, 8)
-    txt_limit = font_large.render(f"{speed_limit}", True, (0, 0, 0))
-    screen.blit(txt_limit, (sign_pos[0] - txt_limit.get_width()//2, sign_pos[1] - txt_limit.get_height()//2))
-    
-    # Pedals
-    bar_w, bar_h = 20, 150
-    # Throttle
-    t_rect_bg = pygame.Rect(SCREEN_WIDTH - 80, SCREEN_HEIGHT - 200, bar_w, bar_h)
-    t_height = int(bar_h * throttle)
-    t_rect_fg = pygame.Rect(SCREEN_WIDTH - 80, SCREEN_HEIGHT - 200 + (bar_h - t_height), bar_w, t_height)
-    pygame.draw.rect(screen, c_gauge_bg, t_rect_bg)
-    pygame.draw.rect(screen, (0, 255, 100), t_rect_fg)
-    
-    # Brake
-    b_rect_bg = pygame.Rect(SCREEN_WIDTH - 120, SCREEN_HEIGHT - 200, bar_w, bar_h)
-    b_height = int(bar_h * brake)
-    b_rect_fg = pygame.Rect(SCREEN_WIDTH - 120, SCREEN_HEIGHT - 200 + (bar_h - b_height), bar_w, b_height)
-    pygame.draw.rect(screen, c_gauge_bg, b_rect_bg)
-    pygame.draw.rect(screen, c_danger, b_rect_fg)
+    txt_limit = LIMIT_SURFS[speed_limit]
+    screen.blit(txt_limit, (SIGN_POS[0] - txt_limit.get_width()//2, SIGN_POS[1] - txt_limit.get_height()//2))
+    
+    # Pedals (only the filled part depends on the inputs)
+    t_height = int(BAR_H * throttle)
+    pygame.draw.rect(screen, C_GAUGE, T_BG_RECT)
+    pygame.draw.rect(screen, C_THROTTLE, (T_BG_RECT.x, T_BG_RECT.bottom - t_height, BAR_W, t_height))
+    
+    b_height = int(BAR_H * brake)
+    pygame.draw.rect(screen, C_GAUGE, B_BG_RECT)
+    pygame.draw.rect(screen, C_DANGER, (B_BG_RECT.x, B_BG_RECT.bottom - b_height, BAR_W, b_height))
 
 def draw_scrolling_road(screen, speed, frame_count):
-    c_road = (40, 40, 40)
-    horizon_y = SCREEN_HEIGHT // 2 - 50
-    
-    pygame.draw.rect(screen, (10, 10, 15), (0, 0, SCREEN_WIDTH, horizon_y))
-    pygame.draw.rect(screen, c_road, (0, horizon_y, SCREEN_WIDTH, SCREEN_HEIGHT))
+    # Sky, ground and perspective guides come from the cached surface
+    screen.blit(ROAD_SURF, (0, 0))
     
     offset = (frame_count * (speed * 0.5)) % 100 
-    center_x = SCREEN_WIDTH // 2
-    
-    pygame.draw.line(screen, (100, 100, 100), (center_x, horizon_y), (0, SCREEN_HEIGHT), 2)
-    pygame.draw.line(screen, (100, 100, 100), (center_x, horizon_y), (SCREEN_WIDTH, SCREEN_HEIGHT), 2)
     
     for i in range(10):
-        y = horizon_y + (i * 40 + offset)
+        y = HORIZON_Y + (i * 40 + offset)
         if y > SCREEN_HEIGHT: y -= 400
-        if y < horizon_y: continue
+        if y < HORIZON_Y: continue
         
-        dist = (y - horizon_y) / (SCREEN_HEIGHT - horizon_y)
+        dist = (y - HORIZON_Y) / ROAD_DEPTH
         width = 20 + dist * 800
-        x_start = center_x - width // 2
+        x_start = ROAD_CENTER_X - width // 2
         
-        if y > horizon_y:
-            pygame.draw.line(screen, (80, 80, 80), (x_start, y), (x_start + width, y), 2)
+        if y > HORIZON_Y:
+            pygame.draw.line(screen, C_ROAD_LINE, (x_start, y), (x_start + width, y), 2)
 
-def draw_live_graph(screen, data_points):
-    rect = pygame.Rect(50, SCREEN_HEIGHT - 150, 300, 100)
-    pygame.draw.rect(screen, (30, 30, 40), rect)
-    pygame.draw.rect(screen, (100, 100, 100), rect, 1)
+def draw_live_graph(screen, history):
+    """Plots the rolling window of (speed, limit) pairs, one polyline per series."""
+    rect = GRAPH_RECT
+    pygame.draw.rect(screen, C_GRAPH_BG, rect)
+    pygame.draw.rect(screen, C_GRAPH_BORDER, rect, 1)
     
-    if len(data_points) < 2: return
-    view_data = data_points[-100:]
+    if len(history) < 2: return
+    speed_pts, limit_pts = graph_points(history)
+    pygame.draw.lines(screen, C_LIMIT_LINE, False, limit_pts, 2)
+    pygame.draw.lines(screen, C_ACCENT, False, speed_pts, 2)
+
+def graph_points(history):
+    """Maps the (speed, limit) window onto GRAPH_RECT. Returns the speed and limit point lists."""
+    rect = GRAPH_RECT
+    view_data = np.array(history, dtype=np.float32)
+    n = len(view_data)
     max_speed = 120
     
-    for i in range(1, len(view_data)):
-        x1 = rect.left + ((i-1) / len(view_data)) * rect.width
-        y1_spd = rect.bottom - (view_data[i-1]['speed'] / max_speed) * rect.height
-        y1_lim = rect.bottom - (view_data[i-1]['speed_limit'] / max_speed) * rect.height
+    xs = (rect.left + np.arange(n) / n * rect.width).tolist()
+    ys_spd = (rect.bottom - view_data[:, 0] / max_speed * rect.height).tolist()
+    ys_lim = (rect.bottom - view_data[:, 1] / max_speed * rect.height).tolist()
+    return list(zip(xs, ys_spd)), list(zip(xs, ys_lim))
+
+def make_gpu_render(renderer, graph_window):
+    """
+    Builds a frame-drawing function (same signature as draw_frame in play_trip) that draws
+    the HUD through the SDL2 renderer. Static art is uploaded once as textures; everything
+    else is renderer rects and lines. SDL lines are 1 px, so the needle and graph are thinner.
+    """
+    from pygame._sdl2.video import Texture
+    road_tex = Texture.from_surface(renderer, ROAD_SURF)
+    chrome_tex = Texture.from_surface(renderer, CHROME_SURF)
+    kmh_tex = Texture.from_surface(renderer, KMH_SURF)
+    limit_texs = {v: Texture.from_surface(renderer, surf) for v, surf in LIMIT_SURFS.items()}
+    speed_texs = {}  # speed readouts, uploaded on first use
+    
+    def fill(color, rect):
+        renderer.draw_color = color
+        renderer.fill_rect(rect)
+    
+    def draw_frame(frame, speed_kmh, limit_kmh, throttle_input, brake_input, prog):
+        # Road
+        road_tex.draw(dstrect=(0, 0))
+        renderer.draw_color = C_ROAD_LINE
+        offset = (frame * (speed_kmh * 0.5)) % 100
+        for i in range(10):
+            y = HORIZON_Y + (i * 40 + offset)
+            if y > SCREEN_HEIGHT: y -= 400
+            if y <= HORIZON_Y: continue
+            width = 20 + (y - HORIZON_Y) / ROAD_DEPTH * 800
+            renderer.fill_rect((ROAD_CENTER_X - width // 2, y - 1, width, 2))
+        
+        # Gauge, needle and sign
+        chrome_tex.draw(dstrect=CHROME_POS)
+        renderer.draw_color = C_ACCENT
+        end_pos = needle_end(speed_kmh)
+        for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            renderer.draw_line((CENTER[0] + dx, CENTER[1] + dy), (end_pos[0] + dx, end_pos[1] + dy))
+        
+        speed_int = int(speed_kmh)
+        if speed_int not in speed_texs:
+            speed_texs[speed_int] = Texture.from_surface(renderer, FONT_LARGE.render(f"{speed_int}", True, C_TEXT))
+        txt = speed_texs[speed_int]
+        txt.draw(dstrect=(CENTER[0] - txt.width // 2, CENTER[1] - 40))
+        kmh_tex.draw(dstrect=(CENTER[0] - kmh_tex.width // 2, CENTER[1] + 20))
+        txt = limit_texs[limit_kmh]
+        txt.draw(dstrect=(SIGN_POS[0] - txt.width // 2, SIGN_POS[1] - txt.height // 2))
+        
+        # Pedals
+        for bg_rect, value, color in ((T_BG_RECT, throttle_input, C_THROTTLE), (B_BG_RECT, brake_input, C_DANGER)):
+            height = int(BAR_H * value)
+            fill(C_GAUGE, bg_rect)
+            fill(color, (bg_rect.x, bg_rect.bottom - height, BAR_W, height))
         
-        x2 = rect.left + (i / len(view_data)) * rect.width
-        y2_spd = rect.bottom - (view_data[i]['speed'] / max_speed) * rect.height
-        y2_lim = rect.bottom - (view_data[i]['speed_limit'] / max_speed) * rect.height
+        # Live graph
+        fill(C_GRAPH_BG, GRAPH_RECT)
+        renderer.draw_color = C_GRAPH_BORDER
+        renderer.draw_rect(GRAPH_RECT)
+        if len(graph_window) >= 2:
+            speed_pts, limit_pts = graph_points(graph_window)
+            for pts, color in ((limit_pts, C_LIMIT_LINE), (speed_pts, C_ACCENT)):
+                renderer.draw_color = color
+                for a, b in zip(pts, pts[1:]):
+                    renderer.draw_line(a, b)
         
-        pygame.draw.line(screen, (150, 50, 50), (x1, y1_lim), (x2, y2_lim), 2)
-        pygame.draw.line(screen, (0, 200, 255), (x1, y1_spd), (x2, y2_spd), 2)
+        # Progress Bar
+        fill(C_ACCENT, (0, 0, int(SCREEN_WIDTH * prog), 5))
+        
+        renderer.present()
+    return draw_frame
 
-# --- 6. Main Loop ---
-def play_trip(trip_id="human_0", style="human", user_id="u_001"):
+# --- 7. Main Loop ---
+def play_trip(trip_id="human_0", style="human", user_id="u_001", use_gpu=False):
     pygame.init()
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-    pygame.display.set_caption(f"Driving DNA - User: {user_id}")
+    if use_gpu:
+        # Hardware renderer: the start screen is drawn off-screen and uploaded each frame
+        from pygame._sdl2.video import Window, Renderer, Texture
+        window = Window(f"Driving DNA - User: {user_id}", size=(SCREEN_WIDTH, SCREEN_HEIGHT))
+        renderer = Renderer(window, accelerated=-1, vsync=True)  # -1: prefer hardware, fall back to software
+        screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+    else:
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption(f"Driving DNA - User: {user_id}")
     clock = pygame.time.Clock()
     font = pygame.font.SysFont("consolas", 24)
+    title_font = pygame.font.SysFont("consolas", 50, bold=True)
+    init_ui_cache()
 
     # --- START SCREEN LOOP ---
     waiting_for_start = True
     start_btn_rect = pygame.Rect(SCREEN_WIDTH//2 - 100, SCREEN_HEIGHT//2 - 30, 200, 60)
     
+    # The start screen never changes, so compose it once and just re-present it while waiting
+    screen.fill(C_BG)
+    
+    # Draw Title
+    title_surf = title_font.render("UBI DATA COLLECTOR", True, C_TEXT)
+    screen.blit(title_surf, (SCREEN_WIDTH//2 - title_surf.get_width()//2, 150))
+    
+    user_surf = font.render(f"Driver ID: {user_id}", True, C_ACCENT)
+    screen.blit(user_surf, (SCREEN_WIDTH//2 - user_surf.get_width()//2, 220))
+    
+    # Draw Button
+    pygame.draw.rect(screen, (0, 150, 0), start_btn_rect, border_radius=10)
+    pygame.draw.rect(screen, (0, 255, 0), start_btn_rect, 3, border_radius=10)
+    
+    btn_text = font.render("START ENGINE", True, C_TEXT)
+    screen.blit(btn_text, (start_btn_rect.centerx - btn_text.get_width()//2, start_btn_rect.centery - btn_text.get_height()//2))
+    
+    ins_surf = font.render("Controls: UP (Gas) | DOWN (Brake) | SPACE (Panic)", True, (150, 150, 150))
+    screen.blit(ins_surf, (SCREEN_WIDTH//2 - ins_surf.get_width()//2, 400))
+    
+    if use_gpu:
+        start_tex = Texture.from_surface(renderer, screen)
+    
     while waiting_for_start:
-        screen.fill((20, 20, 30))
-        
-        # Draw Title
-        title_surf = pygame.font.SysFont("consolas", 50, bold=True).render("UBI DATA COLLECTOR", True, (255, 255, 255))
-        screen.blit(title_surf, (SCREEN_WIDTH//2 - title_surf.get_width()//2, 150))
-        
-        user_surf = font.render(f"Driver ID: {user_id}", True, (0, 200, 255))
-        screen.blit(user_surf, (SCREEN_WIDTH//2 - user_surf.get_width()//2, 220))
-        
-        # Draw Button
-        pygame.draw.rect(screen, (0, 150, 0), start_btn_rect, border_radius=10)
-        pygame.draw.rect(screen, (0, 255, 0), start_btn_rect, 3, border_radius=10)
-        
-        btn_text = font.render("START ENGINE", True, (255, 255, 255))
-        screen.blit(btn_text, (start_btn_rect.centerx - btn_text.get_width()//2, start_btn_rect.centery - btn_text.get_height()//2))
-        
-        ins_surf = font.render("Controls: UP (Gas) | DOWN (Brake) | SPACE (Panic)", True, (150, 150, 150))
-        screen.blit(ins_surf, (SCREEN_WIDTH//2 - ins_surf.get_width()//2, 400))
-
-        pygame.display.flip()
+        if use_gpu:
+            start_tex.draw()
+            renderer.present()
+        else:
+            pygame.display.flip()
         
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -208,144 +514,129 @@ def play_trip(trip_id="human_0", style="human", user_id="u_001"):
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if start_btn_rect.collidepoint(event.pos):
                     waiting_for_start = False
+        clock.tick(30)  # idle instead of spinning while the attract screen is up
     
     # --- SIMULATION LOOP ---
-    current_speed_ms = 0.0
-    current_time_s = 0.0
     trip_plan = create_trip_plan(TRIP_DURATION)
-    data_points = []
-    
-    throttle_input = 0.0
-    brake_input = 0.0
     
-    throttle_hold_time = 0.0
-    brake_hold_time = 0.0
-    
-    running = True
-    frame_count = 0
-
-    while running and current_time_s < TRIP_DURATION:
+    def keyboard_policy(frame_count, speed_kmh, limit_kmh):
         for event in pygame.event.get():
-            if event.type == pygame.QUIT: running = False
+            if event.type == pygame.QUIT: return None
             
         keys = pygame.key.get_pressed()
-        if keys[pygame.K_ESCAPE]: running = False
-        
-        # Exponential Inputs
-        if keys[pygame.K_UP]:
-            throttle_hold_time += TIMESTEP
-            step = 0.05 + (0.15 * min(1.0, throttle_hold_time / 2.0))
-            throttle_input = min(1.0, throttle_input + step)
-        else:
-            throttle_hold_time = 0.0 
-            throttle_input = max(0.0, throttle_input - 0.15) 
-            
-        if keys[pygame.K_DOWN]:
-            brake_hold_time += TIMESTEP
-            step = 0.1 + (0.25 * min(1.0, brake_hold_time / 1.0))
-            brake_input = min(1.0, brake_input + step)
-        else:
-            brake_hold_time = 0.0
-            brake_input = max(0.0, brake_input - 0.15)
-        
-        if keys[pygame.K_SPACE]: 
-            brake_input = 1.0; throttle_input = 0.0
-            
-        # Physics
-        current_limit_kmh = get_current_limit(current_time_s, trip_plan)
-        force_engine = throttle_input * MAX_ENGINE_FORCE
-        force_brake = brake_input * MAX_BRAKE_FORCE
-        resistance = ROLLING_RESISTANCE if current_speed_ms > 0 else 0
-        force_drag = 0.5 * AIR_DENSITY * DRAG_COEFFICIENT * CAR_FRONTAL_AREA * (current_speed_ms ** 2)
-        net_force = force_engine - force_brake - force_drag - resistance
-        
-        accel = net_force / CAR_MASS
-        current_speed_ms += accel * TIMESTEP
-        if current_speed_ms < 0: current_speed_ms = 0
-        if current_speed_ms > 60: current_speed_ms = 60 
-        current_speed_kmh = current_speed_ms * 3.6
-        
-        is_speeding = 1 if current_speed_kmh > (current_limit_kmh + 2) else 0
-        
-        data_points.append({
-            "time": round(current_time_s, 2),
-            "speed": round(current_speed_kmh, 2),
-            "acceleration": round(accel, 2),
-            "speed_limit": current_limit_kmh,
-            "is_speeding": is_speeding,
-            "throttle": round(throttle_input, 2),
-            "brake": round(brake_input, 2),
-        })
-        
-        # Drawing
-        screen.fill((20, 20, 30))
-        draw_scrolling_road(screen, current_speed_kmh, frame_count)
-        draw_dashboard(screen, current_speed_kmh, current_limit_kmh, throttle_input, brake_input)
-        draw_live_graph(screen, data_points)
+        if keys[pygame.K_ESCAPE]: return None
+        return keys[pygame.K_UP], keys[pygame.K_DOWN], keys[pygame.K_SPACE]
+    
+    graph_window = deque(maxlen=100)  # last (speed, limit) pairs for the live graph
+    
+    first_frame = True
+    
+    def draw_frame(frame, speed_kmh, limit_kmh, throttle_input, brake_input, prog):
+        nonlocal first_frame
+        draw_scrolling_road(screen, speed_kmh, frame)
+        draw_dashboard(screen, speed_kmh, limit_kmh, throttle_input, brake_input)
+        draw_live_graph(screen, graph_window)
         
         # Progress Bar
-        prog = current_time_s / TRIP_DURATION
-        pygame.draw.rect(screen, (0, 200, 255), (0, 0, int(SCREEN_WIDTH * prog), 5))
+        pygame.draw.rect(screen, C_ACCENT, (0, 0, int(SCREEN_WIDTH * prog), 5))
         
-        pygame.display.flip()
-        current_time_s += TIMESTEP
-        frame_count += 1
-        clock.tick(int(1.0/TIMESTEP))
+        # The first frame replaces the start screen; after that only the dirty regions change
+        if first_frame:
+            pygame.display.flip()
+            first_frame = False
+        else:
+            pygame.display.update(DIRTY_RECTS)
+    
+    if use_gpu:
+        draw_frame = make_gpu_render(renderer, graph_window)
+    
+    # Fixed-timestep physics with a free-running render: after each physics tick, frames are
+    # drawn at RENDER_FPS until one TIMESTEP of real time has accumulated, easing the displayed
+    # speed from the previous tick to this one. If drawing falls behind, ticks are stepped
+    # without drawing until the simulation catches up with real time.
+    prev_speed = 0.0
+    accumulator = 0.0
+    
+    def render(frame_count, speed_kmh, limit_kmh, throttle_input, brake_input, log):
+        nonlocal prev_speed, accumulator
+        graph_window.append((speed_kmh, limit_kmh))
+        start_speed, prev_speed = prev_speed, speed_kmh
+        prog = log[-1, 0] / TRIP_DURATION
+        
+        if accumulator >= TIMESTEP:
+            accumulator -= TIMESTEP
+            return
+        while accumulator < TIMESTEP:
+            alpha = accumulator / TIMESTEP
+            display_speed = start_speed + (speed_kmh - start_speed) * alpha
+            draw_frame(frame_count - 1 + alpha, display_speed, limit_kmh, throttle_input, brake_input, prog)
+            accumulator += clock.tick(RENDER_FPS) / 1000.0
+            pygame.event.pump()
+        accumulator -= TIMESTEP
+    
+    log = simulate_trip(trip_plan, keyboard_policy, on_step=render)
 
     pygame.quit()
     
-    # --- CLOUD UPLOAD ---
-    print(f"Connecting to Cloud for user {user_id}...")
+    # --- LOCAL SAVE + CLOUD UPLOAD ---
+    # The _id is assigned client-side so the local copy can carry it before the upload finishes
+    trip_data = {
+        "_id": ObjectId(),
+        "trip_id": trip_id,
+        "user_id": user_id, 
+        "style": style,
+        "risk_label": None, 
+        "trip_plan": trip_plan,
+        "quant": QUANT_SCALES,
+        "sequence": log_to_sequence(log),
+        "timestamp": time.time()
+    }
+    
+    # Save the local copy in data/raw_human first (it's what predict_risk reads next)
     try:
-        client = pymongo.MongoClient(MONGO_URI)
-        db = client["ubi_database"]
-        trips_col = db["trips"]
-        
-        trip_data = {
-            "trip_id": trip_id,
-            "user_id": user_id, 
-            "style": style,
-            "risk_label": None, 
-            "trip_plan": trip_plan,
-            "sequence": data_points,
-            "timestamp": time.time()
-        }
+        local_path = os.path.join(DATA_DIR, f"{trip_id}.json")
+        with open(local_path, "wb") as f:
+            f.write(orjson.dumps({**trip_data, "_id": str(trip_data["_id"])}, option=orjson.OPT_SERIALIZE_NUMPY))
+        print(f"💾 Saved local copy to {local_path}")
+    except Exception as e_local:
+        print(f"⚠️ WARNING: Could not save local copy. {e_local}")
+    
+    # Upload in the background; the interpreter still waits for it before exiting
+    upload_thread = threading.Thread(target=upload_trip, args=(trip_data,))
+    upload_thread.start()
+    return upload_thread
 
-        trips_col.insert_one(trip_data)
-        print(f"✅ SUCCESS: Trip uploaded for {user_id}!")
-        # Also save a local copy in data/raw_human
-        try:
-            # Ensure directory exists (already created at module load, but be safe)
-            os.makedirs(DATA_DIR, exist_ok=True)
-            # Include Mongo _id if available by re-querying the inserted document's id
-            # Mongo returns an ObjectId on insert; we'll attach its string form
-            # Note: insert_one doesn't assign _id to our local dict, so we can fetch last inserted
-            # But safer is to use the result of insert_one; however we didn't capture it above.
-            # To keep the change minimal, we will insert with result and update filename accordingly.
-            # Re-insert with capturing result would duplicate data in DB; instead, attempt to get the
-            # most recent trip with same trip_id and user_id and timestamp.
-            inserted = trips_col.find_one({"trip_id": trip_id, "user_id": user_id}, sort=[("timestamp", -1)])
-            if inserted and "_id" in inserted:
-                trip_data_local = dict(trip_data)
-                trip_data_local["_id"] = str(inserted["_id"]) 
-            else:
-                trip_data_local = trip_data
-
-            local_path = os.path.join(DATA_DIR, f"{trip_id}.json")
-            with open(local_path, "w", encoding="utf-8") as f:
-                json.dump(trip_data_local, f, ensure_ascii=False, indent=2)
-
-            print(f"💾 Saved local copy to {local_path}")
-        except Exception as e_local:
-            print(f"⚠️ WARNING: Could not save local copy. {e_local}")
+def upload_trip(trip_data):
+    """Inserts a finished trip into the cloud trips collection."""
+    if not MONGO_URI:
+        print("❌ ERROR: MONGO_URI not found! Make sure .env file exists. Trip kept locally only.")
+        return
+    print(f"Connecting to Cloud for user {trip_data['user_id']}...")
+    try:
+        client = pymongo.MongoClient(MONGO_URI)
+        trips_col = client["ubi_database"]["trips"]
+        # BSON has no numpy types, so the quantized columns go up as plain int lists (BSON int32)
+        sequence = {field: col.tolist() for field, col in trip_data["sequence"].items()}
+        trips_col.insert_one({**trip_data, "sequence": sequence})
+        print(f"✅ SUCCESS: Trip uploaded for {trip_data['user_id']}!")
     except Exception as e:
         print(f"❌ ERROR: Could not upload. {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive a trip, or generate trips headlessly.")
+    parser.add_argument("--headless", action="store_true", help="skip the window and clock; use a scripted driver")
+    parser.add_argument("--trips", type=int, default=100, help="number of trips to generate in headless mode")
+    parser.add_argument("--user", default="u_001", help="user ID recorded on headless trips")
+    parser.add_argument("--gpu", action="store_true", help="draw with the SDL2 hardware renderer")
+    args = parser.parse_args()
+    if args.headless:
+        run_headless(args.trips, args.user)
+        exit()
+    
     print("\n--- SELECT DRIVER ---")
     print("Available Users: u_001 (Niranjan), u_002 (Iranna), u_003 (Rushil)")
     target_user = input("Enter User ID to drive as (default u_001): ").strip()
     if target_user == "": target_user = "u_001"
         
     t_id = f"human_{int(time.time())}"
-    play_trip(trip_id=t_id, user_id=target_user)
\ No newline at end of file
+    play_trip(trip_id=t_id, user_id=target_user, use_gpu=args.gpu)
\ No newline at end of file
@@ -1,12 +1,13 @@
 import numpy as np
-import json
+import orjson
 import joblib
 import os
 import glob
-from tensorflow.keras.models import load_model
+from trip_core import load_sequence
 
 # --- Configuration ---
-MODEL_PATH = "models/driver_model.h5"
+MODEL_PATH = "models/driver_model.keras"
+LEGACY_MODEL_PATH = "models/driver_model.h5"  # HDF5 model from older trainings
 SCALER_PATH = "models/scaler.pkl"
 HUMAN_DATA_DIR = "data/raw_human"
 TIMESTEPS = 360  # Must match training
@@ -19,48 +20,72 @@ def get_latest_human_file():
         return None
     return max(list_of_files, key=os.path.getctime)
 
-def predict_trip(file_path):
-    # 1. Load Model and Scaler
-    if not os.path.exists(MODEL_PATH) or not os.path.exists(SCALER_PATH):
-        print("Error: Model or Scaler not found. Train the model first!")
-        return
+def get_model_path():
+    """Prefers the .keras model, falling back to a legacy .h5 one."""
+    return MODEL_PATH if os.path.exists(MODEL_PATH) else LEGACY_MODEL_PATH
 
-    model = load_model(MODEL_PATH)
-    scaler = joblib.load(SCALER_PATH)
-    
-    print(f"\n--- Analyzing Trip: {os.path.basename(file_path)} ---")
+# Loaded on first use and reused across calls (see load_assets)
+_MODEL = None
+_SCALER = None
+
+def load_assets():
+    """Loads the model and scaler once. TensorFlow is only imported when a prediction is needed."""
+    global _MODEL, _SCALER
+    if _MODEL is None:
+        from tensorflow.keras.models import load_model
+        _MODEL = load_model(get_model_path())
+        _SCALER = joblib.load(SCALER_PATH)
+    return _MODEL, _SCALER
 
-    # 2. Load and Parse JSON
-    with open(file_path, 'r') as f:
-        trip = json.load(f)
+def prepare_sequence(file_path, out=None):
+    """
+    Loads a trip .json file and returns its (TIMESTEPS, FEATURES) matrix, unscaled.
+    If `out` is given (e.g. a row of a preallocated batch), the result is written into it.
+    """
+    with open(file_path, 'rb') as f:
+        trip = orjson.loads(f.read())
     
-    # Extract features
-    raw_sequence = []
-    for point in trip['sequence']:
-        features = [point[f] for f in FEATURES]
-        raw_sequence.append(features)
+    # Extract features (one columnar pass; handles per-point and columnar sequences)
+    raw_sequence = load_sequence(trip)[FEATURES].to_numpy(dtype=np.float32)
     
-    # 3. Fix Sequence Length (Padding or Truncating)
+    # Fix Sequence Length (Padding or Truncating)
     # The model DEMANDS exactly 360 timesteps. Human trips might be 359 or 361.
-    raw_sequence = np.array(raw_sequence)
-    
+    if out is not None:
+        # Copy straight into the caller's buffer, repeating the last frame as padding
+        n = min(len(raw_sequence), TIMESTEPS)
+        out[:n] = raw_sequence[:n]
+        out[n:] = raw_sequence[n - 1]
+        return out
     if len(raw_sequence) > TIMESTEPS:
         # Truncate (cut off extra seconds)
         raw_sequence = raw_sequence[:TIMESTEPS]
     elif len(raw_sequence) < TIMESTEPS:
         # Pad (repeat the last frame)
-        padding = np.tile(raw_sequence[-1], (TIMESTEPS - len(raw_sequence), 1))
-        raw_sequence = np.vstack((raw_sequence, padding))
-        
-    # 4. Scale Data
-    # Reshape to (360, 6) -> Scale -> Reshape back to (1, 360, 6)
-    scaled_sequence = scaler.transform(raw_sequence)
-    input_data = scaled_sequence.reshape(1, TIMESTEPS, len(FEATURES))
-    
-    # 5. Predict
-    prediction = model.predict(input_data, verbose=0)[0][0]
+        raw_sequence = np.pad(raw_sequence, ((0, TIMESTEPS - len(raw_sequence)), (0, 0)), mode='edge')
+    return raw_sequence
+
+def predict_trips(paths):
+    """Scores several trip files with one batched model call. Returns an array of risk scores."""
+    model, scaler = load_assets()
+    batch = np.empty((len(paths), TIMESTEPS, len(FEATURES)), dtype=np.float32)
+    for i, path in enumerate(paths):
+        prepare_sequence(path, out=batch[i])
+    # Scale all K trips at once: (K, 360, 6) -> (K*360, 6) -> (K, 360, 6)
+    scaled = scaler.transform(batch.reshape(-1, len(FEATURES))).reshape(batch.shape)
+    return model.predict(scaled, batch_size=min(32, len(paths)), verbose=0)[:, 0]
+
+def predict_trip(file_path):
+    # 1. Check Model and Scaler
+    if not os.path.exists(get_model_path()) or not os.path.exists(SCALER_PATH):
+        print("Error: Model or Scaler not found. Train the model first!")
+        return
+
+    print(f"\n--- Analyzing Trip: {os.path.basename(file_path)} ---")
+
+    # 2. Load, Scale and Predict (a batch of one)
+    prediction = predict_trips([file_path])[0]
     
-    # 6. Output Results
+    # 3. Output Results
     print(f"\n>>> CALCULATED RISK SCORE: {prediction:.4f}")
     
     # Interpret score
@@ -1,33 +1,81 @@
+import argparse
 import numpy as np
 import pandas as pd
-import json
 import os
 import glob
+import hashlib
+import multiprocessing as mp
+from trip_features import TIMESTEPS, FEATURES, parse_trip_file
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler
-import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense, Dropout
-from tensorflow.keras.optimizers import Adam  # Import Adam
-import matplotlib.pyplot as plt
-import tensorflow.keras.callbacks as callbacks
-from tensorflow.keras.callbacks import EarlyStopping
+# TensorFlow is imported by init_tensorflow(), after the data is loaded (see parse_json_files)
 import joblib # Add this at the top with other imports
 
 # --- 1. Configuration ---
 DATA_DIR = "data/raw"
-MODEL_SAVE_PATH = "models/driver_model.h5"
-TIMESTEPS = 360  # Updated to match your 3-minute (360 sec) duration
-FEATURES = ['speed', 'acceleration', 'speed_limit', 'is_speeding', 'throttle', 'brake']
+PARQUET_PATH = "data/trips.parquet"   # written by generate_data.py
+CACHE_DIR = "data/cache"              # parsed JSON trips, as float32 .npy pairs
+MODEL_SAVE_PATH = "models/driver_model.keras"  # Keras v3 format (was HDF5 .h5)
+TFLITE_SAVE_PATH = "models/driver_model.tflite"
+BACKUP_DIR = "models/backup"          # training state, so an interrupted run resumes
+# TIMESTEPS and FEATURES come from trip_features.py
+
+# Larger batches keep the cuDNN LSTM and Tensor Cores busy; override with BATCH_SIZE=256 etc.
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", 128))
+# Square-root scaling from the original lr=1e-4 tuned at batch size 16
+LEARNING_RATE = 1e-4 * np.sqrt(BATCH_SIZE / 16)
+# XLA-compile the train step (fuses the gate pointwise ops and the Dense/Dropout head).
+# Off by default: under XLA Keras runs the LSTM on its generic kernel instead of the fused
+# cuDNN one, and on CPU Keras leaves XLA off for good reason. Set XLA_ENABLED=1 to compare.
+XLA_ENABLED = os.environ.get("XLA_ENABLED", "0") == "1"
 
 # Ensure models directory exists
 os.makedirs("models", exist_ok=True)
 
+# Set by init_tensorflow()
+tf = None
+USE_MIXED_PRECISION = False
+INPUT_DTYPE = None   # dtype the model input and the dequantized training batches use
+
+def init_tensorflow():
+    """Imports TensorFlow and applies the precision policy. Called by main() once the data is loaded."""
+    global tf, USE_MIXED_PRECISION, INPUT_DTYPE
+    import tensorflow
+    tf = tensorflow
+    # Mixed precision: LSTM matmuls run in float16 on Tensor Cores, weights and loss stay float32.
+    # Only worth it on a GPU; on CPU float16 is slower, so training stays in float32 there.
+    USE_MIXED_PRECISION = bool(tf.config.list_physical_devices('GPU'))
+    if USE_MIXED_PRECISION:
+        tf.keras.mixed_precision.set_global_policy('mixed_float16')
+    INPUT_DTYPE = tf.float16 if USE_MIXED_PRECISION else tf.float32
+
+# Scaled features are held as uint8 (value * 255) and dequantized batch by batch in tf.data
+X_QUANT_LEVELS = 255
+
 # --- 2. Data Loading Function ---
+# extract_features and the per-file parser live in trip_features.py (TensorFlow-free, for the workers)
+
+def load_parquet_data():
+    """Loads sequences and labels from the single columnar table written by generate_data.py."""
+    df = pd.read_parquet(PARQUET_PATH, columns=["trip_id", "risk_label", "time"] + FEATURES)
+    df = df.sort_values(["trip_id", "time"], kind="stable")
+    
+    # Keep only trips with the expected number of timesteps
+    sizes = df.groupby("trip_id", sort=False).size()
+    skipped = sizes[sizes != TIMESTEPS]
+    if len(skipped):
+        print(f"Skipping {len(skipped)} trips: incorrect length. Expected {TIMESTEPS}")
+        df = df[~df["trip_id"].isin(skipped.index)]
+    
+    X = df[FEATURES].to_numpy(dtype=np.float32).reshape(-1, TIMESTEPS, len(FEATURES))
+    y = df.groupby("trip_id", sort=False)["risk_label"].first().to_numpy(dtype=np.float32)
+    print(f"Successfully loaded {len(X)} sequences from {PARQUET_PATH}.")
+    return X, y
+
 def load_data():
     """Loads all trip files and extracts sequences and labels."""
-    sequences = []
-    labels = []
+    if os.path.exists(PARQUET_PATH):
+        return load_parquet_data()
     
     # Use glob to find all json files in the directory
     json_files = glob.glob(os.path.join(DATA_DIR, "*.json"))
@@ -38,136 +86,311 @@ def load_data():
         return None, None
 
     print(f"Found {len(json_files)} trip files. Loading...")
+    return load_or_build_cache(json_files)
 
-    for file_path in json_files:
-        with open(file_path, 'r') as f:
-            trip = json.load(f)
-            
-            # Extract the sequence data for our chosen features
-            sequence_data = []
-            for point in trip['sequence']:
-                
-                # Dynamically build the feature list for this time step
-                features_for_this_point = [point[feature_name] for feature_name in FEATURES]
-                sequence_data.append(features_for_this_point)
-            
-            # Ensure sequence is the correct length
-            if len(sequence_data) == TIMESTEPS:
-                sequences.append(sequence_data)
-                labels.append(trip['risk_label'])
+def load_or_build_cache(json_files):
+    """
+    Returns (X, y) for the given trip files from the .npy cache, parsing and caching them first
+    if needed. The cache key covers every file name and mtime, so any added, removed or edited
+    trip triggers a rebuild. Cached X is memory-mapped rather than read into RAM.
+    """
+    fingerprint = "\n".join(f"{os.path.basename(p)}:{os.stat(p).st_mtime_ns}" for p in sorted(json_files))
+    key = hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
+    x_path = os.path.join(CACHE_DIR, f"{key}_X.npy")
+    y_path = os.path.join(CACHE_DIR, f"{key}_y.npy")
+    
+    if os.path.exists(x_path) and os.path.exists(y_path):
+        X = np.load(x_path, mmap_mode='r')
+        y = np.load(y_path)
+        print(f"Loaded {len(X)} sequences from cache {x_path}.")
+        return X, y
+    
+    X, y = parse_json_files(sorted(json_files))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    np.save(y_path, y, allow_pickle=False)
+    # X is written last and renamed into place, so its presence marks a complete cache entry
+    np.save(x_path + ".tmp.npy", X, allow_pickle=False)
+    os.replace(x_path + ".tmp.npy", x_path)
+    return X, y
+
+def parse_json_files(json_files):
+    """Parses trip files across all cores into float32 (X, y), dropping trips of the wrong length."""
+    # JSON decoding is CPU-bound, so it runs in worker processes; each returns one contiguous
+    # array (cheap to pickle) that is copied into its row of the preallocated buffer
+    X = np.empty((len(json_files), TIMESTEPS, len(FEATURES)), dtype=np.float32)
+    y = np.empty(len(json_files), dtype=np.float32)
+    valid = np.zeros(len(json_files), dtype=bool)
+    skipped = []
+
+    # TensorFlow isn't imported yet (see init_tensorflow), so workers are safe to fork, and
+    # on spawn/forkserver platforms re-importing this module in a worker stays cheap
+
+    # imap (not imap_unordered) keeps rows in file order, so the cache and split are reproducible
+    with mp.Pool(os.cpu_count()) as pool:
+        for i, (arr, label) in enumerate(pool.imap(parse_trip_file, json_files, chunksize=32)):
+            if arr is not None:
+                X[i] = arr
+                y[i] = label
+                valid[i] = True
             else:
-                print(f"Skipping file {file_path}: incorrect length. Expected {TIMESTEPS}, got {len(sequence_data)}")
+                skipped.append(json_files[i])
 
-    print(f"Successfully loaded {len(sequences)} sequences.")
-    return np.array(sequences), np.array(labels)
+    if skipped:
+        print(f"Skipped {len(skipped)} files: incorrect length. Expected {TIMESTEPS}")
+    X, y = X[valid], y[valid]
+    print(f"Successfully loaded {len(X)} sequences.")
+    return X, y
 
 # --- 3. Preprocessing Function ---
 def preprocess_data(X, y):
-    """Scales the data, saves the scaler, and splits into train/test sets."""
+    """Scales the data, saves the scaler, and splits it into train/test index arrays."""
     
-    scaler = MinMaxScaler()
-    
-    # Reshape to 2D, fit, and transform
-    X_reshaped = X.reshape(-1, len(FEATURES))
-    X_scaled_reshaped = scaler.fit_transform(X_reshaped)
-    X_scaled = X_scaled_reshaped.reshape(X.shape)
+    # Min-max scale each feature in place in float32 (no 2D reshape round-trip)
+    X = np.asarray(X, dtype=np.float32)
+    if not X.flags.writeable:
+        X = X.copy()  # memory-mapped cache
+    mn = X.min(axis=(0, 1), keepdims=True)
+    mx = X.max(axis=(0, 1), keepdims=True)
+    data_range = mx - mn
+    data_range[data_range == 0] = 1.0  # constant features map to 0, as MinMaxScaler does
+    np.subtract(X, mn, out=X)
+    np.divide(X, data_range, out=X)
+    # Values are in [0, 1] now; quantize to uint8, a quarter of the float32 memory and
+    # host-to-device traffic. The input pipeline dequantizes (see dequantize).
+    np.multiply(X, X_QUANT_LEVELS, out=X)
+    np.rint(X, out=X)
+    X_scaled = X.astype(np.uint8)
     
     # --- NEW: Save the scaler for later use! ---
+    # Inference loads the MinMaxScaler pickle; fitting it on the two extreme rows reproduces
+    # exactly these min/max values. The raw arrays are saved alongside for non-sklearn readers.
+    scaler = MinMaxScaler().fit(np.vstack([mn.reshape(1, -1), mx.reshape(1, -1)]))
     scaler_filename = "models/scaler.pkl"
     joblib.dump(scaler, scaler_filename)
+    np.savez("models/scaler_minmax.npz", min=mn.ravel(), max=mx.ravel())
     print(f"Scaler saved to {scaler_filename}")
     
-    # Split the data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_scaled, y, test_size=0.2, random_state=42
+    # Split indices rather than the 3D array, so the split doesn't duplicate X.
+    # Labels are the two style scores (0.1 / 0.9), so they stratify directly.
+    idx_train, idx_test = train_test_split(
+        np.arange(len(y)), test_size=0.2, random_state=42, shuffle=True, stratify=y
     )
+    # Sorted indices gather X in memory order
+    idx_train.sort()
+    idx_test.sort()
     
-    return X_train, X_test, y_train, y_test
+    return X_scaled, y, idx_train, idx_test
 
 # --- 4. Model Building Function ---
-def build_model():
-    """Builds the LSTM model architecture."""
-    model = Sequential()
+def build_network(input_dtype):
+    """Builds the (uncompiled) LSTM model architecture; hidden layers follow the global dtype policy."""
+    from tensorflow.keras.models import Model
+    from tensorflow.keras.layers import Input, LSTM, Dense, Dropout, Activation, LeakyReLU
     
     # Input shape is (TIMESTEPS, FEATURES)
-    # Using 64 units and a Dropout of 0.5 as we established
-    model.add(LSTM(64, input_shape=(TIMESTEPS, len(FEATURES))))
+    inputs = Input(shape=(TIMESTEPS, len(FEATURES)), dtype=input_dtype)
     
-    # Dropout layer to prevent overfitting
-    model.add(Dropout(0.5))
+    # Using 64 units; the head below uses a lighter Dropout of 0.2.
+    # These arguments are the ones Keras requires to dispatch the LSTM to the fused cuDNN
+    # kernel on GPU; keep them at these values (see check_cudnn_eligibility).
+    x = LSTM(64,
+             activation='tanh',
+             recurrent_activation='sigmoid',
+             recurrent_dropout=0.0,
+             unroll=False,
+             use_bias=True)(inputs)
     
-    # A hidden Dense layer
-    model.add(Dense(32, activation='relu'))
+    # A hidden Dense layer. With XLA_ENABLED, Dense -> LeakyReLU -> Dropout compiles into one XLA cluster.
+    x = Dense(32)(x)
+    x = LeakyReLU(0.1)(x)
     
-    # Final output layer (1 neuron, sigmoid for 0-1 score)
-    model.add(Dense(1, activation='sigmoid'))
+    # Dropout layer to prevent overfitting (0.5 doubled gradient variance and slowed convergence)
+    x = Dropout(0.2)(x)
+    
+    # Final output layer (1 neuron, sigmoid for 0-1 score).
+    # Kept in float32 so the sigmoid doesn't saturate under mixed precision.
+    x = Dense(1, dtype='float32')(x)
+    outputs = Activation('sigmoid', dtype='float32')(x)
+    
+    return Model(inputs, outputs)
+
+def build_model():
+    """Builds and compiles the LSTM model for training."""
+    from tensorflow.keras.optimizers import Adam
+    
+    # The input dtype matches what the data pipeline feeds (float16 under mixed
+    # precision), so batches reach the LSTM without a cast.
+    model = build_network(INPUT_DTYPE)
     
     # --- Optimizer with stable learning rate and gradient clipping ---
-    optimizer = Adam(learning_rate=0.0001, clipvalue=1.0) 
+    optimizer = Adam(learning_rate=LEARNING_RATE, clipvalue=1.0) 
+    if USE_MIXED_PRECISION:
+        # Dynamic loss scaling keeps small float16 gradients from underflowing
+        optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
     
-    model.compile(loss='mean_squared_error', 
+    # Cross-entropy against the sigmoid doesn't vanish when the output saturates, unlike MSE.
+    # The 0.1 / 0.9 labels act as soft targets. The sigmoid stays in the model because
+    # inference reads probabilities; Keras computes this loss from its logits internally.
+    model.compile(loss='binary_crossentropy', 
                   optimizer=optimizer, 
-                  metrics=['mean_absolute_error'])
+                  metrics=[tf.keras.metrics.MeanAbsoluteError()],
+                  jit_compile=XLA_ENABLED,
+                  # Run 32 batches per tf.function call to amortize per-step dispatch
+                  steps_per_execution=32)
     
     model.summary()
+    check_cudnn_eligibility(model)
     return model
 
+def check_cudnn_eligibility(model):
+    """Logs the GPUs TensorFlow sees and whether each LSTM layer can use the cuDNN kernel."""
+    from tensorflow.keras.layers import LSTM
+    gpus = tf.config.list_physical_devices('GPU')
+    print(f"GPUs available: {len(gpus)} {[gpu.name for gpu in gpus]}")
+    
+    for layer in model.layers:
+        if not isinstance(layer, LSTM):
+            continue
+        eligible = (
+            layer.activation.__name__ == 'tanh'
+            and layer.recurrent_activation.__name__ == 'sigmoid'
+            and layer.recurrent_dropout == 0
+            and not layer.unroll
+            and layer.use_bias
+        )
+        if not gpus:
+            note = " (no GPU: generic kernel)"
+        elif XLA_ENABLED:
+            note = " (XLA_ENABLED: XLA bypasses cuDNN, generic kernel)"
+        else:
+            note = ""
+        print(f"LSTM '{layer.name}' cuDNN-eligible: {eligible}{note}")
+
 # --- 5. Training and Plotting Function ---
-def train_and_plot(model, X_train, y_train, X_test, y_test):
-    """Trains the model and plots the history."""
+def dequantize(x, y):
+    """tf.data map: uint8 feature batch back to [0, 1] in the model's input dtype."""
+    return tf.cast(x, INPUT_DTYPE) * tf.constant(1 / X_QUANT_LEVELS, INPUT_DTYPE), y
+
+def make_datasets(X, y, idx_train, idx_test):
+    """Builds the train and test tf.data pipelines from the idx_train / idx_test rows of X."""
+    # tf.data pipelines: batching and shuffling overlap with training instead of
+    # slicing NumPy on the host between steps. Each split is gathered from X only here.
+    ds_tr = (tf.data.Dataset.from_tensor_slices((X[idx_train], y[idx_train]))
+             .cache()
+             .shuffle(8192)
+             .batch(BATCH_SIZE)
+             .map(dequantize, num_parallel_calls=tf.data.AUTOTUNE)
+             .prefetch(tf.data.AUTOTUNE))
+    ds_te = (tf.data.Dataset.from_tensor_slices((X[idx_test], y[idx_test]))
+             .batch(64)
+             .map(dequantize, num_parallel_calls=tf.data.AUTOTUNE)
+             .prefetch(tf.data.AUTOTUNE))
+    return ds_tr, ds_te
+
+def train_and_plot(model, ds_tr, ds_te, plot=False):
+    """Trains the model, validating on ds_te, and plots the history if asked."""
+    import tensorflow.keras.callbacks as callbacks
+    from tensorflow.keras.callbacks import EarlyStopping
     print("\n--- Starting Model Training ---")
     
-    # Train for 50 epochs with a batch size of 16
+    # Train for up to 35 epochs, stopping once validation loss plateaus
     history = model.fit(
-        X_train, y_train,
+        ds_tr,
         epochs=35,  # Changed from 50 to 35
-        batch_size=16,
-        validation_data=(X_test, y_test),
-        verbose=1 
-        # ,callbacks=[EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)]
+        validation_data=ds_te,
+        verbose=1,
+        callbacks=[
+            EarlyStopping(monitor='val_loss', patience=7, restore_best_weights=True),
+            callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3),
+            # Removed again once fit() completes
+            callbacks.BackupAndRestore(BACKUP_DIR),
+        ]
     )
     
     print("--- Training Complete ---")
 
+    if plot:
+        plot_history(history)
+    
+    return model
+
+def plot_history(history):
+    """Saves the training & validation loss curves to training_loss_plot.png."""
+    # Imported here, with the non-GUI backend, so runs without --plot never load matplotlib
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
     # Plot training & validation loss
     plt.figure(figsize=(10, 5))
     plt.plot(history.history['loss'], label='Training Loss')
     plt.plot(history.history['val_loss'], label='Validation Loss')
     plt.title('Model Loss Over Epochs')
-    plt.ylabel('Loss (MSE)')
+    plt.ylabel('Loss (BCE)')
     plt.xlabel('Epoch')
     plt.legend()
     plt.savefig('training_loss_plot.png')
     print("Saved training loss plot to 'training_loss_plot.png'")
+
+# --- 6. Inference Export Function ---
+def export_tflite(model):
+    """Converts the trained model to a float16-weight TFLite FlatBuffer for the dashboard."""
+    if USE_MIXED_PRECISION:
+        # TFLite builtin kernels need float32 activations, so export a float32-policy copy
+        # of the network (float32 input too) carrying the trained weights
+        tf.keras.mixed_precision.set_global_policy('float32')
+        try:
+            export_model = build_network(tf.float32)
+        finally:
+            tf.keras.mixed_precision.set_global_policy('mixed_float16')
+        export_model.set_weights(model.get_weights())
+        model = export_model
     
-    return model
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    tflite_model = converter.convert()
+    
+    with open(TFLITE_SAVE_PATH, "wb") as f:
+        f.write(tflite_model)
+    print(f"TFLite model saved to {TFLITE_SAVE_PATH}")
 
-# --- 6. Main Execution ---
-def main():
+# --- 7. Main Execution ---
+def main(plot=False):
     # Step 1: Load Data
     X, y = load_data()
     if X is None or len(X) == 0:
         print("Data loading failed or no data found. Exiting.")
         return
+    
+    # TensorFlow is only imported now that the parse workers are done
+    init_tensorflow()
         
     # Step 2: Preprocess Data
-    X_train, X_test, y_train, y_test = preprocess_data(X, y)
+    X, y, idx_train, idx_test = preprocess_data(X, y)
     
     # Step 3: Build Model
     model = build_model()
     
     # Step 4: Train Model
-    model = train_and_plot(model, X_train, y_train, X_test, y_test)
+    ds_tr, ds_te = make_datasets(X, y, idx_train, idx_test)
+    model = train_and_plot(model, ds_tr, ds_te, plot=plot)
     
-    # Step 5: Evaluate Final Model
+    # Step 5: Evaluate Final Model (on the same prefetched test pipeline)
     print("\n--- Evaluating Model on Test Set ---")
-    loss, mae = model.evaluate(X_test, y_test, verbose=0)
-    print(f"Final Test Loss (MSE): {loss:.4f}")
+    loss, mae = model.evaluate(ds_te, verbose=0)
+    print(f"Final Test Loss (BCE): {loss:.4f}")
     print(f"Final Test Mean Absolute Error: {mae:.4f}")
     
     # Step 6: Save Model
     model.save(MODEL_SAVE_PATH)
     print(f"\nModel successfully saved to {MODEL_SAVE_PATH}")
+    
+    # Step 7: Export for low-latency inference
+    export_tflite(model)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the driver risk model.")
+    parser.add_argument("--plot", action="store_true", help="save the loss curves to training_loss_plot.png")
+    args = parser.parse_args()
+    main(plot=args.plot)
\ No newline at end of file
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+# Trip-plan logic and the stored trip format, shared by generate_data.py (synthetic trips),
+# play_trip.py (human trips) and the readers (train_model, predict_risk, admin_dashboard)
+
+# --- 1. Speed Zone Definitions (km/h) ---
+SPEED_ZONES = {
+    "residential": 30,
+    "main_road": 60,
+    "highway": 80
+}
+
+_ZONE_LIMITS = np.fromiter(SPEED_ZONES.values(), dtype=int)
+
+# --- 2. Trip Plan Functions ---
+def create_trip_plan(duration):
+    """Creates a random sequence of speed zones (20-40 s each) covering the trip."""
+    # Sample enough zones for the worst case (every zone at minimum length), then cut at duration
+    max_zones = duration // 20 + 1
+    zone_durations = np.random.randint(20, 41, size=max_zones)
+    speed_limits = _ZONE_LIMITS[np.random.randint(0, len(_ZONE_LIMITS), size=max_zones)]
+
+    end_times = np.minimum(np.cumsum(zone_durations), duration)
+    n_zones = int(np.searchsorted(end_times, duration)) + 1
+    end_times = end_times[:n_zones]
+    start_times = np.concatenate(([0], end_times[:-1]))
+
+    return [
+        {"start": start, "end": end, "limit": limit}
+        for start, end, limit in zip(start_times.tolist(), end_times.tolist(), speed_limits[:n_zones].tolist())
+    ]
+
+def get_limit_by_step(plan, n_steps, timestep):
+    """Expands a trip plan into the speed limit of every simulation step (step i is t = i * timestep)."""
+    limit_by_step = np.full(n_steps, plan[-1]["limit"], dtype=np.int16)
+    for zone in plan:
+        limit_by_step[round(zone["start"] / timestep):round(zone["end"] / timestep)] = zone["limit"]
+    return limit_by_step
+
+# --- 3. Telemetry Quantization ---
+# Stored telemetry is quantized to integers: value = stored / scale.
+# Writers save this table as the trip's "quant" field; readers undo it with dequantize().
+QUANT_SCALES = {
+    "time": 100,            # int32, 0.01 s resolution
+    "speed": 100,           # int16, 0.01 km/h resolution
+    "acceleration": 100,    # int16, 0.01 m/s^2 resolution
+    "throttle": 255,        # uint8
+    "brake": 255            # uint8
+}
+
+def dequantize(field, values, quant):
+    """Returns a stored column's real values, given the trip's "quant" table (unquantized fields pass through)."""
+    scale = quant.get(field)
+    return values if scale is None else values / scale
+
+def load_sequence(trip):
+    """Loads a trip sequence into a DataFrame, undoing any stored quantization."""
+    df = pd.DataFrame(trip['sequence'])
+    quant = trip.get('quant', {})
+    for col in df.columns:
+        df[col] = dequantize(col, df[col], quant)
+    return df
@@ -0,0 +1,46 @@
+import numpy as np
+import orjson
+import operator
+import itertools
+from trip_core import dequantize
+
+# Trip-file parsing for train_model.py. Kept free of TensorFlow so the parse worker
+# processes (see train_model.parse_json_files) start light and are safe to fork.
+
+# --- 1. Feature Layout ---
+TIMESTEPS = 360  # Updated to match your 3-minute (360 sec) duration
+FEATURES = ['speed', 'acceleration', 'speed_limit', 'is_speeding', 'throttle', 'brake']
+
+_get_features = operator.itemgetter(*FEATURES)
+
+# --- 2. Parsing Functions ---
+def extract_features(trip):
+    """Returns a trip's (T, FEATURES) float32 matrix, undoing any stored quantization."""
+    seq = trip['sequence']
+    if isinstance(seq, dict):
+        # Columnar layout: one list per field
+        data = np.array(_get_features(seq), dtype=np.float32).T
+    else:
+        # Per-point dicts: one C-level lookup of all features per point, streamed
+        # straight into a (T, FEATURES) float32 array with no per-point tuples list
+        values = itertools.chain.from_iterable(map(_get_features, seq))
+        data = np.fromiter(values, dtype=np.float32, count=len(seq) * len(FEATURES))
+        data = data.reshape(len(seq), len(FEATURES))
+    quant = trip.get('quant', {})
+    for j, col in enumerate(FEATURES):
+        data[:, j] = dequantize(col, data[:, j], quant)
+    return data
+
+def parse_trip_file(file_path):
+    """Worker: parses one trip file into its (TIMESTEPS, FEATURES) matrix and label, or (None, None)."""
+    # Bytes straight to orjson, in 1 MiB reads
+    with open(file_path, 'rb', buffering=1 << 20) as f:
+        trip = orjson.loads(f.read())
+
+    # Extract the sequence data for our chosen features
+    sequence_data = extract_features(trip)
+
+    # Ensure sequence is the correct length (skips are reported once by the caller)
+    if len(sequence_data) != TIMESTEPS:
+        return None, None
+    return sequence_data, trip['risk_label']